@@ -22,6 +22,9 @@ setup(
     , keywords         = "xelatex sphinx extension"
     , packages         = find_packages(exclude=['docs', 'tests'])
     , install_requires = install_requires
+    , entry_points     = {
+        'console_scripts': [
+            'sphinx-xelatex-watch = xelatex_ext.watch:main' ]}
 
     # See https://pypi.python.org/pypi?%3Aaction=list_classifiers
     , classifiers = [
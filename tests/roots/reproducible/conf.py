@@ -0,0 +1,27 @@
+# -*- coding: utf-8; mode: python -*-
+#
+# Test project of the reproducible build test (see test_reproducible.py)
+
+import sys
+from os.path import abspath, join, dirname
+
+sys.path.insert(0, abspath(join(dirname(__file__), '..', '..', '..')))
+
+extensions = ["xelatex_ext"]
+master_doc = 'index'
+project    = 'reproducible'
+copyright  = '2016, Markus Heiser'
+version    = '1'
+release    = '1'
+
+latex_paper_size = "a4paper"
+latex_font_size  = "12pt"
+
+xelatex_documents = [
+    dict(docname         = "index"
+         , targetname    = "reproducible.tex"
+         , documentclass = "manual")
+    , dict(docname           = "index"
+           , targetname      = "reproducible-split.tex"
+           , documentclass   = "manual"
+           , split_fragments = True) ]
@@ -0,0 +1,77 @@
+# -*- coding: utf-8; mode: python -*-
+u"""
+    stubtex
+    ~~~~~~~
+
+    A stub of the TeX engine for the tests of the compile stage.
+
+    :copyright:  Copyright (C) 2016 Markus Heiser
+    :license:    GPL V3.0, see LICENSE for details.
+
+    Usage: ``python stubtex.py [-ini] [-recorder] <texfile>``
+
+    The stub writes the files a TeX run would write, its behavior is controlled
+    by lines of the TeX file:
+
+    * ``% stubtex:stable=<n>``: the ``.aux`` file changes until the n-th run
+      (default ``2``)
+    * ``% stubtex:index``: an ``.idx`` file is written
+    * ``% stubtex:error``: the run fails with a TeX error
+    * ``% stubtex:rerun``: each run asks for a rerun
+    * ``\\RequirePackage{<name>}``: ``<name>.sty`` is an input of the run (it is
+      recorded in the ``.fls`` file with ``-recorder``)
+
+    The product is a ``.fmt`` file with ``-ini``, otherwise a ``.pdf`` file.
+    The number of the runs is counted in ``<jobname>.runs``.
+"""
+
+import io
+import os
+import re
+import sys
+
+from os import path
+
+def main(argv):
+    texfile = argv[-1]
+    jobname = path.splitext(path.basename(texfile))[0]
+    with io.open(texfile, encoding='utf-8') as f:
+        source = f.read()
+
+    runs = 1
+    if path.exists(jobname + '.runs'):
+        with open(jobname + '.runs') as f:
+            runs = int(f.read()) + 1
+    with open(jobname + '.runs', 'w') as f:
+        f.write(str(runs))
+    print('This is StubTeX, run %s' % runs)
+
+    if '% stubtex:error' in source:
+        print('! Undefined control sequence.')
+        print('l.3 \\foo')
+        return 1
+
+    if '% stubtex:rerun' in source:
+        print('LaTeX Warning: Label(s) may have changed. '
+              'Rerun to get cross-references right.')
+
+    stable = re.search(r'% stubtex:stable=(\d+)', source)
+    stable = int(stable.group(1)) if stable else 2
+    with open(jobname + '.aux', 'w') as f:
+        f.write('run %s\n' % min(runs, stable))
+    if '% stubtex:index' in source:
+        with open(jobname + '.idx', 'w') as f:
+            f.write('\\indexentry{stub}{1}\n')
+    if '-recorder' in argv:
+        with open(jobname + '.fls', 'w') as f:
+            f.write('PWD %s\n' % os.getcwd())
+            f.write('INPUT %s\n' % texfile)
+            for name in re.findall(r'\\RequirePackage\{([^}]+)\}', source):
+                f.write('INPUT %s.sty\n' % name)
+    product = '.fmt' if '-ini' in argv else '.pdf'
+    with open(jobname + product, 'w') as f:
+        f.write('stub %s\n' % runs)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
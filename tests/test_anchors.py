@@ -0,0 +1,47 @@
+# -*- coding: utf-8; mode: python -*-
+u"""
+    test_anchors
+    ~~~~~~~~~~~~
+
+    The anchors of the documents in the TeX output: a reference to a document
+    (``:doc:``) has to point to a ``\\label`` of the target.
+
+    :copyright:  Copyright (C) 2016 Markus Heiser
+    :license:    GPL V3.0, see LICENSE for details.
+"""
+
+import io
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from os import path
+
+ROOT = path.join(path.dirname(path.abspath(__file__)), 'roots', 'reproducible')
+
+BUILD = (
+    'import sys, sphinx;'
+    'sys.exit(sphinx.main(["sphinx-build", "-q", "-E", "-b", "xelatex"'
+    ', sys.argv[1], sys.argv[2]]))')
+
+def read(folder, fname):
+    with io.open(path.join(folder, fname), encoding='utf-8') as f:
+        return f.read()
+
+def test_doc_anchor():
+    tempdir = tempfile.mkdtemp(dir=os.environ.get('TEST_TEMPDIR'))
+    try:
+        subprocess.check_call([sys.executable, '-c', BUILD, ROOT, tempdir])
+        output = read(tempdir, 'reproducible.tex')
+        # the chapter is a fragment of the split target
+        split  = (read(tempdir, 'reproducible-split.tex')
+                  + read(tempdir, 'reproducible-split-chapter.tex'))
+    finally:
+        shutil.rmtree(tempdir)
+    for tex in (output, split):
+        assert '\\hyperref[chapter::doc]' in tex
+        assert len(re.findall(r'\\label\{chapter::doc\}', tex)) == 1
+        assert '\\label{index::doc}' in tex
@@ -0,0 +1,192 @@
+# -*- coding: utf-8; mode: python -*-
+u"""
+    test_compiler
+    ~~~~~~~~~~~~~
+
+    The compile driver (:py:class:`CompileJob`) with a stub of the TeX engine
+    (see stubtex.py).
+
+    :copyright:  Copyright (C) 2016 Markus Heiser
+    :license:    GPL V3.0, see LICENSE for details.
+"""
+
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from os import path
+
+sys.path.insert(0, path.abspath(path.join(path.dirname(__file__), '..')))
+
+from xelatex_ext.builders.compiler import CompileJob
+
+STUBTEX = path.join(path.dirname(path.abspath(__file__)), 'stubtex.py')
+
+TEX_COMMAND = [sys.executable, STUBTEX, '-recorder', '%(texfile)s']
+
+INDEX_COMMAND = [
+    sys.executable, '-c'
+    , 'import sys; open(sys.argv[1][:-4] + ".ind", "w").write("ind")'
+    , '%(jobname)s.idx']
+
+def write(folder, fname, source):
+    with io.open(path.join(folder, fname), 'w', encoding='utf-8') as f:
+        f.write(source)
+
+def runs(folder, jobname):
+    with open(path.join(folder, jobname + '.runs')) as f:
+        return int(f.read())
+
+def with_tempdir(func):
+    def wrapper():
+        tempdir = tempfile.mkdtemp(dir=os.environ.get('TEST_TEMPDIR'))
+        try:
+            func(tempdir)
+        finally:
+            shutil.rmtree(tempdir)
+    wrapper.__name__ = func.__name__
+    return wrapper
+
+@with_tempdir
+def test_reruns_until_stable(tempdir):
+    write(tempdir, 'book.tex', u'% stubtex:stable=3\n')
+    result = CompileJob('book.tex', TEX_COMMAND, tempdir, max_passes=5).run()
+    assert result['status'] == 'ok'
+    # the .aux file is unchanged by the 4th pass
+    assert result['passes'] == 4
+    assert result['stable']
+    assert runs(tempdir, 'book') == 4
+
+@with_tempdir
+def test_max_passes(tempdir):
+    write(tempdir, 'book.tex', u'% stubtex:stable=3\n')
+    result = CompileJob('book.tex', TEX_COMMAND, tempdir, max_passes=2).run()
+    assert result['status'] == 'ok'
+    assert result['passes'] == 2
+    assert not result['stable']
+
+@with_tempdir
+def test_single_pass(tempdir):
+    # e.g. latexmk: the engine does the reruns, only its rerun request counts
+    write(tempdir, 'book.tex', u'% stubtex:stable=3\n')
+    result = CompileJob('book.tex', TEX_COMMAND, tempdir, max_passes=1).run()
+    assert result['passes'] == 1
+    assert result['stable']
+    write(tempdir, 'book.tex', u'% stubtex:rerun\n')
+    result = CompileJob('book.tex', TEX_COMMAND, tempdir, max_passes=1).run()
+    assert result['status'] == 'ok'
+    assert not result['stable']
+
+@with_tempdir
+def test_uptodate(tempdir):
+    write(tempdir, 'book.tex', u'\\RequirePackage{mystyle}\n')
+    write(tempdir, 'mystyle.sty', u'% style\n')
+    job = CompileJob('book.tex', TEX_COMMAND, tempdir, max_passes=5)
+    assert job.run()['status'] == 'ok'
+    count = runs(tempdir, 'book')
+
+    result = job.run()
+    assert result['status'] == 'uptodate'
+    assert result['passes'] == 0
+    assert runs(tempdir, 'book') == count
+
+    # a recorded input has been changed
+    write(tempdir, 'mystyle.sty', u'% changed style\n')
+    assert job.run()['status'] == 'ok'
+    assert runs(tempdir, 'book') > count
+
+    # the product has been removed
+    count = runs(tempdir, 'book')
+    os.remove(path.join(tempdir, 'book.pdf'))
+    assert job.run()['status'] == 'ok'
+    assert runs(tempdir, 'book') > count
+
+@with_tempdir
+def test_missing_engine(tempdir):
+    write(tempdir, 'book.tex', u'\n')
+    lines  = []
+    result = CompileJob(
+        'book.tex', [path.join(tempdir, 'no-such-engine'), '%(texfile)s']
+        , tempdir).run(lambda job, line: lines.append(line))
+    assert result['returncode'] == 127
+    assert result['status'] == 'failed'
+    assert lines and 'no-such-engine' in lines[0]
+    assert not path.exists(path.join(tempdir, 'book.xelatex-stamp'))
+
+@with_tempdir
+def test_failed(tempdir):
+    write(tempdir, 'book.tex', u'% stubtex:error\n')
+    result = CompileJob('book.tex', TEX_COMMAND, tempdir, max_passes=5).run()
+    assert result['returncode'] == 1
+    assert result['status'] == 'failed'
+    assert result['passes'] == 1
+    error = result['diagnostics']['records'][0]
+    assert error['kind'] == 'error' and error['texline'] == 3
+    assert not path.exists(path.join(tempdir, 'book.xelatex-stamp'))
+
+@with_tempdir
+def test_index(tempdir):
+    write(tempdir, 'book.tex', u'% stubtex:index\n')
+    job = CompileJob('book.tex', TEX_COMMAND, tempdir, max_passes=5
+                     , index_command=INDEX_COMMAND)
+    result = job.run()
+    assert result['status'] == 'ok'
+    assert result['index'] == 1
+    assert result['stable']
+    assert path.exists(path.join(tempdir, 'book.ind'))
+
+    # the .idx file is unchanged: no index run
+    write(tempdir, 'book.tex', u'% stubtex:index\n% changed\n')
+    result = job.run()
+    assert result['status'] == 'ok'
+    assert result['index'] == 0
+
+    # the .ind file is missing
+    os.remove(path.join(tempdir, 'book.ind'))
+    write(tempdir, 'book.tex', u'% stubtex:index\n')
+    result = job.run()
+    assert result['index'] == 1
+    assert path.exists(path.join(tempdir, 'book.ind'))
+
+@with_tempdir
+def test_format(tempdir):
+    write(tempdir, 'preamble.tex', u'\\RequirePackage{mystyle}\n')
+    write(tempdir, 'mystyle.sty', u'% style\n')
+    job = CompileJob(
+        'preamble.tex', [sys.executable, STUBTEX, '-ini', '-recorder'
+                         , '%(texfile)s']
+        , tempdir, product='.fmt')
+    assert job.run()['status'] == 'ok'
+    assert path.exists(path.join(tempdir, 'preamble.fmt'))
+    assert job.run()['status'] == 'uptodate'
+
+    # the format is dumped again, if a package of the preamble is changed
+    write(tempdir, 'mystyle.sty', u'% changed style\n')
+    assert job.run()['status'] == 'ok'
+    assert runs(tempdir, 'preamble') == 2
+
+BUILD = (
+    'import sys, sphinx;'
+    'sys.exit(sphinx.main(["sphinx-build", "-q", "-b", "xelatex"'
+    ', "-D", "xelatex_shared_preamble=1", "-D", "xelatex_preamble_format=1"'
+    ', "-D", "xelatex_format_command=" + sys.argv[3]'
+    ', sys.argv[1], sys.argv[2]]))')
+
+def build_format(outdir):
+    root = path.join(path.dirname(path.abspath(__file__)), 'roots', 'reproducible')
+    command = ','.join([sys.executable, STUBTEX, '-ini', '-recorder', '%(texfile)s'])
+    subprocess.check_call([sys.executable, '-c', BUILD, root, outdir, command])
+    with io.open(path.join(outdir, 'xelatex-report.json'), encoding='utf-8') as f:
+        return json.load(f)['xelatex-preamble.tex']['compile']
+
+@with_tempdir
+def test_dump_preamble_format(tempdir):
+    outdir = path.join(tempdir, 'out')
+    result = build_format(outdir)
+    assert result['status'] == 'ok'
+    assert path.exists(path.join(outdir, 'xelatex-preamble.fmt'))
+    assert build_format(outdir)['status'] == 'uptodate'
@@ -0,0 +1,59 @@
+# -*- coding: utf-8; mode: python -*-
+u"""
+    test_parallel
+    ~~~~~~~~~~~~~
+
+    A parallel build has to result in the same TeX output as a serial build.
+
+    :copyright:  Copyright (C) 2016 Markus Heiser
+    :license:    GPL V3.0, see LICENSE for details.
+"""
+
+import hashlib
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from os import path
+
+ROOT = path.join(path.dirname(path.abspath(__file__)), 'roots', 'reproducible')
+
+BUILD = (
+    'import sys, sphinx;'
+    'sys.exit(sphinx.main(["sphinx-build", "-q", "-E", "-b", "xelatex"'
+    ', "-j", sys.argv[3], "-D", "xelatex_targets=" + sys.argv[4]'
+    ', sys.argv[1], sys.argv[2]]))')
+
+def build(outdir, parallel, targets):
+    subprocess.check_call(
+        [sys.executable, '-c', BUILD, ROOT, outdir, str(parallel), targets])
+    digests = dict()
+    for fname in os.listdir(outdir):
+        if fname.endswith('.tex'):
+            with open(path.join(outdir, fname), 'rb') as f:
+                digests[fname] = hashlib.sha1(f.read()).hexdigest()
+    return digests
+
+def test_parallel_fragments():
+    # the fragments of a single target are translated by the worker processes
+    tempdir = tempfile.mkdtemp(dir=os.environ.get('TEST_TEMPDIR'))
+    try:
+        serial   = build(path.join(tempdir, 'serial'), 1, 'reproducible-split.tex')
+        parallel = build(path.join(tempdir, 'parallel'), 3, 'reproducible-split.tex')
+    finally:
+        shutil.rmtree(tempdir)
+    assert 'reproducible-split-chapter.tex' in serial
+    assert 'reproducible-split-second.tex' in serial
+    assert serial == parallel
+
+def test_parallel_targets():
+    tempdir = tempfile.mkdtemp(dir=os.environ.get('TEST_TEMPDIR'))
+    try:
+        serial   = build(path.join(tempdir, 'serial'), 1, '*')
+        parallel = build(path.join(tempdir, 'parallel'), 3, '*')
+    finally:
+        shutil.rmtree(tempdir)
+    assert 'reproducible.tex' in serial
+    assert serial == parallel
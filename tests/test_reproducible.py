@@ -0,0 +1,53 @@
+# -*- coding: utf-8; mode: python -*-
+u"""
+    test_reproducible
+    ~~~~~~~~~~~~~~~~~
+
+    Builds of the same input have to result in the same TeX output.
+
+    :copyright:  Copyright (C) 2016 Markus Heiser
+    :license:    GPL V3.0, see LICENSE for details.
+"""
+
+import hashlib
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from os import path
+
+ROOT = path.join(path.dirname(path.abspath(__file__)), 'roots', 'reproducible')
+
+BUILD = (
+    'import sys, sphinx;'
+    'sys.exit(sphinx.main(["sphinx-build", "-q", "-E", "-b", "xelatex"'
+    ', sys.argv[1], sys.argv[2]]))')
+
+def build(outdir, hashseed):
+    # each build in its own process, with its own hash seed: the output must not
+    # depend on the iteration order of sets
+    env = dict(os.environ, PYTHONHASHSEED=str(hashseed)
+               , SOURCE_DATE_EPOCH='1467331200')
+    subprocess.check_call(
+        [sys.executable, '-c', BUILD, ROOT, outdir], env=env)
+    digests = dict()
+    for fname in os.listdir(outdir):
+        if fname.endswith('.tex'):
+            with open(path.join(outdir, fname), 'rb') as f:
+                digests[fname] = hashlib.sha1(f.read()).hexdigest()
+    return digests
+
+def test_reproducible():
+    tempdir = tempfile.mkdtemp(dir=os.environ.get('TEST_TEMPDIR'))
+    try:
+        first  = build(path.join(tempdir, 'first'), 1)
+        others = [build(path.join(tempdir, 'build-%s' % seed), seed)
+                  for seed in (4, 5)]
+    finally:
+        shutil.rmtree(tempdir)
+    assert 'reproducible.tex' in first
+    assert 'reproducible-split-chapter.tex' in first
+    for digests in others:
+        assert first == digests
@@ -0,0 +1,97 @@
+# -*- coding: utf-8; mode: python -*-
+u"""
+    test_texlog
+    ~~~~~~~~~~~
+
+    Parser of the TeX engine's output (:py:class:`TeXLogParser`).
+
+    :copyright:  Copyright (C) 2016 Markus Heiser
+    :license:    GPL V3.0, see LICENSE for details.
+"""
+
+import sys
+
+from os import path
+
+sys.path.insert(0, path.abspath(path.join(path.dirname(__file__), '..')))
+
+from xelatex_ext.builders.texlog import TeXLogParser, TEX_LINE_LENGTH, marker
+
+def parse(lines, **kwargs):
+    parser = TeXLogParser(**kwargs)
+    for line in lines:
+        parser.feed(line)
+    parser.close()
+    return parser.result()
+
+def typeout(what, docname):
+    # the line TeX prints for a marker
+    return marker(what, docname)[len('\\typeout{'):].replace(
+        '\\detokenize{', '').rstrip('}\n')
+
+def test_error_texline():
+    result = parse([
+        '(./book.tex'
+        , '! Undefined control sequence.'
+        , 'l.42 \\foo'
+        , '          bar'])
+    assert result['counts']['error'] == 1
+    error = result['records'][0]
+    assert error['kind'] == 'error'
+    assert error['message'] == 'Undefined control sequence.'
+    assert error['texline'] == 42
+
+def test_error_without_texline():
+    # the "l.<n>" line is only taken from the lines following the error
+    result = parse(['! Emergency stop.'] + ['*'] * 12 + ['l.7 \\end'])
+    assert result['records'][0]['texline'] is None
+
+def test_wrapped_lines():
+    message = "LaTeX Warning: Reference `chapter:%s' on page 3 undefined on input line 12."
+    message = message % ('x' * (2 * TEX_LINE_LENGTH - len(message) - 8))
+    lines   = [message[i:i + TEX_LINE_LENGTH]
+               for i in range(0, len(message), TEX_LINE_LENGTH)]
+    assert len(lines) == 2 and len(lines[1]) < TEX_LINE_LENGTH
+    result = parse(lines)
+    assert result['counts']['undefined_reference'] == 1
+    record = result['records'][0]
+    assert record['message'].startswith('chapter:xxx')
+    assert record['texline'] == 12
+
+def test_wrapped_last_line():
+    # a wrapped line at the end of the output is parsed by close()
+    result = parse(['! ' + 'x' * (TEX_LINE_LENGTH - 2)])
+    assert result['counts']['error'] == 1
+
+def test_markers():
+    result = parse([
+        typeout('start-of-file', 'index')
+        , 'Overfull \\hbox (12.0pt too wide) in paragraph at lines 10--12'
+        , typeout('start-of-file', 'chapter/one')
+        , "LaTeX Warning: Citation `knuth' on page 2 undefined on input line 20."
+        , typeout('end-of-file', 'chapter/one')
+        , 'Underfull \\vbox (badness 10000) has occurred while \\output is active'
+        , typeout('end-of-file', 'index')
+        , 'LaTeX Warning: There were undefined references.'])
+    records = [(r['kind'], r['docname'], r['texline'])
+               for r in result['records']]
+    assert records == [
+        ('overfull', 'index', 10)
+        , ('undefined_citation', 'chapter/one', 20)
+        , ('underfull', 'index', None)
+        , ('warning', None, None)]
+
+def test_rerun():
+    assert not parse(['Output written on book.pdf'])['rerun']
+    assert parse([
+        'LaTeX Warning: Label(s) may have changed. Rerun to get cross-references right.'
+        ])['rerun']
+
+def test_max_records():
+    result = parse(['! Missing $ inserted.'] * 5 + ['LaTeX Warning: foo.'] * 5
+                   , max_records=3)
+    assert len(result['records']) == 3
+    assert result['counts'] == dict(
+        error=5, warning=5, overfull=0, underfull=0, undefined_reference=0
+        , undefined_citation=0)
+    assert result['dropped'] == 7
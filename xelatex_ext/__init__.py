@@ -25,7 +25,41 @@ def setup(app):
 # ==============================================================================
 
     u"""initialize *this* sphinx extension"""
+    from xelatex_ext.builders.compiler import (
+        DEFAULT_TEX_COMMAND, DEFAULT_INDEX_COMMAND, DEFAULT_FORMAT_COMMAND)
     from xelatex_ext.builders.xelatex import XeLaTeXBuilder
     app.add_builder(XeLaTeXBuilder)
+    app.add_config_value("xelatex_targets", [], '')
     app.add_config_value("xelatex_documents", [], '')
+    app.add_config_value("xelatex_build_report", "xelatex-report.json", '')
+    app.add_config_value("xelatex_memory_profile", False, '')
+    app.add_config_value("xelatex_memory_top", 10, '')
+    app.add_config_value("xelatex_log_level", None, '')
+    app.add_config_value("xelatex_worker_max_targets", 0, '')
+    app.add_config_value("xelatex_worker_max_rss", 0, '')
+    app.add_config_value("xelatex_fail_fast", True, '')
+    app.add_config_value("xelatex_resume", False, '')
+    app.add_config_value("xelatex_compile", False, '')
+    app.add_config_value("xelatex_compile_jobs", 0, '')
+    app.add_config_value("xelatex_tex_command", DEFAULT_TEX_COMMAND, '')
+    app.add_config_value("xelatex_compile_max_passes", 4, '')
+    app.add_config_value("xelatex_index_command", DEFAULT_INDEX_COMMAND, '')
+    app.add_config_value("xelatex_shared_preamble", False, '')
+    app.add_config_value("xelatex_preamble_format", False, '')
+    app.add_config_value("xelatex_format_command", DEFAULT_FORMAT_COMMAND, '')
+    app.add_config_value("xelatex_split_fragments", False, '')
+    app.add_config_value("xelatex_include_only", [], '')
+    app.add_config_value("xelatex_draft", False, '')
+    app.add_config_value("xelatex_image_dpi", None, '')
+    app.add_config_value("xelatex_image_max_width", 6.5, '')
+    app.add_config_value("xelatex_native_index", False, '')
+    app.add_config_value("xelatex_stream_assembly", False, '')
+    app.add_config_value("xelatex_external_refs", True, '')
+    app.add_config_value("xelatex_asset_store", None, '')
+    app.add_config_value("xelatex_asset_link", 'hardlink', '')
+    app.add_config_value("xelatex_fragment_cache", False, '')
+    app.add_config_value("xelatex_fragment_cache_size", 256 * 1024**2, '')
+    app.add_config_value("xelatex_artifact_cache", None, '')
+    app.add_config_value("xelatex_artifact_cache_size", 2 * 1024**3, '')
+    app.add_config_value("xelatex_artifact_cache_pdf", False, '')
 
@@ -0,0 +1,195 @@
+# -*- coding: utf-8; mode: python -*-
+# pylint: disable=C0330
+
+u"""
+    xelatex_ext.builders.artifacts
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Content-addressed cache of the build artifacts.
+
+    :copyright:  Copyright (C) 2016 Markus Heiser
+    :license:    GPL V3.0, see LICENSE for details.
+
+    The artifacts of a target (the generated TeX files and optionally the PDF)
+    are stored in an :py:class:`ArtifactCache` under the fingerprint of the
+    target (see :py:meth:`XeLaTeXBuilder.target_fingerprint`).  If the
+    fingerprint of a target is found in the cache, the artifacts are copied
+    into the output folder and the target is not built.
+
+    The :py:class:`LocalDirCache` backend stores the artifacts in a local
+    folder, which can be shared by several builds (e.g. CI jobs of different
+    branches):
+
+    .. code-block:: python
+
+        # conf.py
+
+        xelatex_artifact_cache      = '/var/cache/xelatex-artifacts'
+        xelatex_artifact_cache_size = 4 * 1024**3   # 4 GiB
+        xelatex_artifact_cache_pdf  = True
+
+    Other backends implement the interface of :py:class:`ArtifactCache`, an
+    instance of the backend is set as ``xelatex_artifact_cache``.
+"""
+
+# ==============================================================================
+#  imports
+# ==============================================================================
+
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from contextlib import contextmanager
+from os import path
+
+from six import text_type
+
+from xelatex_ext.builders.outfile import copy_if_changed
+
+try:
+    import fcntl
+except ImportError:  # not available on windows
+    fcntl = None
+
+# ==============================================================================
+class ArtifactCache(object):
+# ==============================================================================
+
+    u"""Interface of an artifact cache backend."""
+
+    def get(self, key, folder):
+        u"""Copy the files of entry *key* into *folder*.
+
+        Returns the *meta* data of the entry or ``None`` if there is no entry
+        with this key."""
+        raise NotImplementedError
+
+    def put(self, key, folder, fnames, meta=None):
+        u"""Store the files *fnames* (names relative to *folder*) and the *meta*
+        data (JSON serializable) in entry *key*."""
+        raise NotImplementedError
+
+    def evict(self):
+        u"""Drop entries to fit the limits of the cache."""
+        pass
+
+# ==============================================================================
+class LocalDirCache(ArtifactCache):
+# ==============================================================================
+
+    u"""Artifact cache in a local folder.
+
+    :param str folder: Folder of the cache.
+    :param int max_size: Maximal size (bytes) of all entries, if exceeded, the
+        *least recently used* entries are dropped by :py:meth:`evict`.
+
+    Each entry is a folder named by its key.  Entries are written into a
+    temporary folder and renamed when complete, the eviction is serialized by
+    a lock file; so the cache can be used by concurrent builds.
+    """
+
+    META = 'xelatex-artifact.json'
+    LOCK = '.lock'
+
+    def __init__(self, folder, max_size=None):
+        self.folder   = folder
+        self.max_size = max_size
+
+    def entry(self, key):
+        return path.join(self.folder, key[:2], key)
+
+    def get(self, key, folder):
+        entry = self.entry(key)
+        try:
+            with io.open(path.join(entry, self.META), encoding='utf-8') as f:
+                data = json.load(f)
+            for fname in data['files']:
+                copy_if_changed(path.join(entry, fname), path.join(folder, fname))
+            # mark the entry as used (LRU)
+            os.utime(entry, None)
+        except (IOError, OSError, ValueError, KeyError):
+            # no entry or evicted by a concurrent process
+            return None
+        return data['meta']
+
+    def put(self, key, folder, fnames, meta=None):
+        entry = self.entry(key)
+        if path.isdir(entry):
+            return
+        if not path.isdir(self.folder):
+            try:
+                os.makedirs(self.folder)
+            except OSError:  # created by a concurrent process
+                pass
+        tmp = tempfile.mkdtemp(prefix='.tmp-', dir=self.folder)
+        try:
+            for fname in fnames:
+                shutil.copyfile(path.join(folder, fname), path.join(tmp, fname))
+            with io.open(path.join(tmp, self.META), 'w', encoding='utf-8') as f:
+                f.write(text_type(json.dumps(
+                    dict(files=list(fnames), meta=meta), indent=1
+                    , sort_keys=True)))
+            if not path.isdir(path.dirname(entry)):
+                try:
+                    os.makedirs(path.dirname(entry))
+                except OSError:
+                    pass
+            os.rename(tmp, entry)
+        except (IOError, OSError):
+            # missing file or entry stored by a concurrent process
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    @contextmanager
+    def lock(self):
+        if fcntl is None or not path.isdir(self.folder):
+            yield
+            return
+        with open(path.join(self.folder, self.LOCK), 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def entries(self):
+        u"""Return a list of ``(mtime, size, folder)`` tuples of all entries."""
+        retVal = []
+        if not path.isdir(self.folder):
+            return retVal
+        for prefix in os.listdir(self.folder):
+            prefix = path.join(self.folder, prefix)
+            if path.basename(prefix).startswith('.') or not path.isdir(prefix):
+                continue
+            for key in os.listdir(prefix):
+                entry = path.join(prefix, key)
+                try:
+                    size = sum([path.getsize(path.join(entry, fname))
+                                for fname in os.listdir(entry)])
+                    retVal.append((path.getmtime(entry), size, entry))
+                except OSError:  # evicted by a concurrent process
+                    pass
+        return retVal
+
+    def evict(self, max_age=3600):
+        u"""Drop the *least recently used* entries until the size of the cache
+        is below ``max_size``.  Temporary folders older than *max_age* seconds
+        (left by aborted builds) are removed."""
+        with self.lock():
+            if path.isdir(self.folder):
+                for fname in os.listdir(self.folder):
+                    tmp = path.join(self.folder, fname)
+                    if (fname.startswith('.tmp-')
+                        and path.getmtime(tmp) < time.time() - max_age):
+                        shutil.rmtree(tmp, ignore_errors=True)
+            if not self.max_size:
+                return
+            entries = sorted(self.entries())
+            total   = sum([size for _, size, _ in entries])
+            while entries and total > self.max_size:
+                _, size, entry = entries.pop(0)
+                shutil.rmtree(entry, ignore_errors=True)
+                total -= size
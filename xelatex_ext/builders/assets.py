@@ -0,0 +1,109 @@
+# -*- coding: utf-8; mode: python -*-
+# pylint: disable=C0330
+
+u"""
+    xelatex_ext.builders.assets
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Content-addressed store of the assets (images) of the XeLaTeX targets.
+
+    :copyright:  Copyright (C) 2016 Markus Heiser
+    :license:    GPL V3.0, see LICENSE for details.
+
+    Each asset is stored once in the :py:class:`AssetStore`, its name is the
+    digest of its content (plus the extension of the file).  The targets refer
+    to the assets by these names and the assets are linked into the output
+    folders, an image used by many targets (and output folders) is stored (and
+    converted) only once:
+
+    .. code-block:: python
+
+        # conf.py
+
+        xelatex_asset_store = '_build/xelatex-assets'
+        xelatex_asset_link  = 'hardlink'  # or 'symlink' or 'copy'
+"""
+
+# ==============================================================================
+#  imports
+# ==============================================================================
+
+import os
+import shutil
+
+from os import path
+
+from xelatex_ext.builders.fingerprint import file_digest
+from xelatex_ext.builders.outfile import copy_if_changed
+
+# ==============================================================================
+class AssetStore(object):
+# ==============================================================================
+
+    u"""Content-addressed store of the assets.
+
+    :param str folder: Folder of the store.
+    :param str link: How the assets are put into the output folder:
+        ``hardlink``, ``symlink`` or ``copy``.  If a link can't be created
+        (e.g. the output folder is on another file system), the asset is
+        copied.
+    """
+
+    LINK_TYPES = ('hardlink', 'symlink', 'copy')
+
+    def __init__(self, folder, link='hardlink'):
+        if link not in self.LINK_TYPES:
+            raise ValueError("unknown link type '%s'" % link)
+        self.folder = folder
+        self.link   = link
+        self.names  = dict()
+
+    def name(self, fname):
+        u"""Return the name of file *fname* in the store."""
+        stat = os.stat(fname)
+        key  = (path.abspath(fname), stat.st_mtime, stat.st_size)
+        name = self.names.get(key)
+        if name is None:
+            name = file_digest(fname) + path.splitext(fname)[1].lower()
+            self.names[key] = name
+        return name
+
+    def path(self, name):
+        return path.join(self.folder, name)
+
+    def add(self, fname):
+        u"""Add file *fname* to the store (if not yet stored) and return its
+        name."""
+        name = self.name(fname)
+        dst  = self.path(name)
+        if not path.exists(dst):
+            if not path.isdir(self.folder):
+                try:
+                    os.makedirs(self.folder)
+                except OSError:  # created by a concurrent process
+                    pass
+            tmp = dst + '.%s.tmp' % os.getpid()
+            shutil.copyfile(fname, tmp)
+            os.rename(tmp, dst)
+        return name
+
+    def install(self, name, dst):
+        u"""Put the asset *name* to file *dst*.  Returns ``True`` if *dst* has
+        been (re-) created."""
+        src = self.path(name)
+        if path.exists(dst):
+            if path.samefile(src, dst):
+                return False
+            if self.link != 'copy':
+                os.remove(dst)
+        if self.link == 'copy':
+            return copy_if_changed(src, dst)
+        try:
+            if self.link == 'hardlink':
+                os.link(src, dst)
+            else:
+                os.symlink(path.abspath(src), dst)
+        except (OSError, AttributeError):
+            # other file system or no links on this platform
+            copy_if_changed(src, dst)
+        return True
@@ -0,0 +1,82 @@
+# -*- coding: utf-8; mode: python -*-
+# pylint: disable=C0330
+
+u"""
+    xelatex_ext.builders.buildlog
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Level-gated, buffered messages of the XeLaTeX builder.
+
+    :copyright:  Copyright (C) 2016 Markus Heiser
+    :license:    GPL V3.0, see LICENSE for details.
+
+    The builder logs by a :py:class:`BuildLog`:
+
+    * Messages have a level, only the messages up to the level of the build
+      (``xelatex_log_level``) are printed.
+    * Frequent events (e.g. a copied image) are counted and summarized in one
+      line (``copied 2031 images, 1987 unchanged``).
+    * In a parallel process, the messages are buffered and printed by the main
+      process when the process has finished, the processes do not write
+      concurrently to the console.
+"""
+
+# ==============================================================================
+#  module constants
+# ==============================================================================
+
+QUIET   = 0
+NORMAL  = 1
+VERBOSE = 2
+DEBUG   = 3
+
+# ==============================================================================
+class BuildLog(object):
+# ==============================================================================
+
+    u"""Messages and counters of the build.
+
+    :param infofunc: Function printing a message (``Builder.info``).
+    :param int level: Messages with a higher level are dropped.
+
+    :ivar dict counters: The counted events.
+    """
+
+    def __init__(self, infofunc, level=NORMAL):
+        self.infofunc = infofunc
+        self.level    = level
+        self.counters = dict()
+        self.records  = None
+
+    def __call__(self, msg='', nonl=False, level=NORMAL):
+        if level > self.level:
+            return
+        if self.records is not None:
+            self.records.append((msg, nonl))
+        else:
+            self.infofunc(msg, nonl=nonl)
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def pop_counters(self, *names):
+        u"""Return the values of the counters *names* and reset them."""
+        return [self.counters.pop(name, 0) for name in names]
+
+    def buffer(self):
+        u"""Buffer the messages (see :py:meth:`release`)."""
+        self.records = []
+        self.counters = dict()
+
+    def release(self):
+        u"""Stop buffering, return the buffered messages and the counters."""
+        records, self.records = self.records, None
+        return dict(records = records or [], counters = self.counters)
+
+    def replay(self, released):
+        u"""Print the messages and add the counters *released* by a parallel
+        process (see :py:meth:`release`)."""
+        for msg, nonl in released['records']:
+            self.infofunc(msg, nonl=nonl)
+        for name, value in released['counters'].items():
+            self.count(name, value)
@@ -0,0 +1,361 @@
+# -*- coding: utf-8; mode: python -*-
+# pylint: disable=C0330, R0903
+
+u"""
+    xelatex_ext.builders.compiler
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Compile stage of the XeLaTeX builder.
+
+    :copyright:  Copyright (C) 2016 Markus Heiser
+    :license:    GPL V3.0, see LICENSE for details.
+
+    The :py:class:`TeXCompiler` runs the TeX engine (``xelatex_tex_command``)
+    for each target.  At most *jobs* engine processes are running at the same
+    time, the most expensive targets are scheduled first (*longest processing
+    time first*).  The output of the engine is streamed line by line to a
+    callback.
+
+    The command is a list of arguments, where ``%(texfile)s`` and
+    ``%(jobname)s`` are replaced by the target's values:
+
+    .. code-block:: python
+
+        # conf.py
+
+        xelatex_compile     = True
+        xelatex_tex_command = [
+            'latexmk', '-xelatex', '-interaction=nonstopmode', '%(texfile)s']
+        # latexmk does the reruns by itself
+        xelatex_compile_max_passes = 1
+
+    Reruns of the TeX engine are made as long as one of the auxiliary files
+    (:py:data:`AUX_EXTENSIONS`) changes or TeX asks for a rerun, but not more
+    than *max_passes*.  With ``max_passes = 1`` the job is only reported as not
+    stable, if TeX asks for a rerun in the output.  The output of each pass is
+    parsed by the :py:class:`TeXLogParser`, the diagnostics of the last pass
+    are added to the status record.  The index command
+    (``xelatex_index_command``) is only run if the ``.idx`` file has been
+    changed.  After a successful run, the fingerprints of the TeX file and its
+    inputs (from the ``.fls`` file of TeX's ``-recorder`` option) are
+    stored in a ``<jobname>.xelatex-stamp`` file; as long as these inputs are
+    unchanged and the PDF exists, the job is skipped.
+
+    The same driver is used to dump the format of the shared preamble
+    (``xelatex_format_command``), its product is a ``.fmt`` file.  The format
+    is dumped again, if one of the recorded inputs (the shared preamble and the
+    packages of ``xetex_inputs``) has been changed.
+
+    If the environment variable ``SOURCE_DATE_EPOCH`` is set, the engine is
+    run with ``FORCE_SOURCE_DATE=1``, so ``\\today`` and the dates in the PDF
+    are taken from ``SOURCE_DATE_EPOCH`` (reproducible builds).
+"""
+
+# ==============================================================================
+#  imports
+# ==============================================================================
+
+import io
+import json
+import os
+import subprocess
+import threading
+import time
+
+from os import path
+
+from six import text_type
+from six.moves import queue
+
+from xelatex_ext.builders.fingerprint import file_digest
+from xelatex_ext.builders.texlog import TeXLogParser
+
+DEFAULT_TEX_COMMAND = [
+    'xelatex', '-interaction=nonstopmode', '-halt-on-error', '-recorder'
+    , '%(texfile)s']
+
+DEFAULT_INDEX_COMMAND = ['makeindex', '-q', '%(jobname)s.idx']
+
+DEFAULT_FORMAT_COMMAND = [
+    'xelatex', '-ini', '-interaction=nonstopmode', '-recorder'
+    , '-jobname=%(jobname)s', '&xelatex', r'\input{%(texfile)s}\dump']
+
+AUX_EXTENSIONS = ['.aux', '.toc', '.idx', '.out']
+u"""Auxiliary files of a TeX run, compared between the passes."""
+
+GENERATED_EXTENSIONS = AUX_EXTENSIONS + [
+    '.ind', '.ilg', '.log', '.fls', '.pdf', '.fmt', '.lof', '.lot'
+    , '.xelatex-stamp']
+u"""Files generated by a job, they are not inputs of the job."""
+
+# ==============================================================================
+class CompileJob(object):
+# ==============================================================================
+
+    u"""Compile one TeX file.
+
+    :param str texfile: Name of the TeX file (relative to *cwd*).
+    :param list command: Command of the TeX engine (see module description).
+    :param str cwd: Working directory of the TeX run (the output folder).
+    :param int cost: Estimated cost of the job, by default the size of the TeX
+        file is used.
+    :param int max_passes: Maximal number of TeX runs.
+    :param list index_command: Command to build the index or ``None``.
+    :param str product: Extension of the file produced by the job.
+    """
+
+    def __init__(self, texfile, command, cwd, cost=None
+                 , max_passes=1, index_command=None, product='.pdf'):
+        self.texfile       = texfile
+        self.command       = command
+        self.cwd           = cwd
+        self.cost          = cost
+        self.max_passes    = max(1, max_passes)
+        self.index_command = index_command
+        self.product       = product
+        if self.cost is None:
+            try:
+                self.cost = path.getsize(path.join(cwd, texfile))
+            except OSError:
+                self.cost = 0
+
+    @property
+    def jobname(self):
+        name = path.basename(self.texfile)
+        if name.endswith('.tex'):
+            name = name[:-4]
+        return name
+
+    def jobfile(self, ext):
+        return path.join(self.cwd, self.jobname + ext)
+
+    def argv(self, command=None):
+        ctx = dict(texfile=self.texfile, jobname=self.jobname)
+        return [arg % ctx for arg in (command or self.command)]
+
+    def execute(self, argv, linefunc=None, logparser=None):
+        u"""Run *argv* in the working folder and stream its output to
+        *linefunc* and the *logparser*, returns the exit code."""
+        try:
+            proc = subprocess.Popen(
+                argv, cwd=self.cwd, env=engine_env()
+                , stdin=subprocess.PIPE
+                , stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        except OSError as exc:
+            if linefunc is not None:
+                linefunc(self, u'%s: %s' % (argv[0], exc))
+            return 127
+        proc.stdin.close()
+        for line in iter(proc.stdout.readline, b''):
+            line = line.decode('utf-8', 'replace').rstrip('\r\n')
+            if logparser is not None:
+                logparser.feed(line)
+            if linefunc is not None:
+                linefunc(self, line)
+        proc.stdout.close()
+        if logparser is not None:
+            logparser.close()
+        return proc.wait()
+
+    def aux_digests(self):
+        return dict([(ext, file_digest(self.jobfile(ext)))
+                     for ext in AUX_EXTENSIONS])
+
+    # stamp of the last successful build
+    # ----------------------------------
+
+    def read_stamp(self):
+        try:
+            with io.open(self.jobfile('.xelatex-stamp'), encoding='utf-8') as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return dict()
+
+    def write_stamp(self, stamp):
+        with io.open(self.jobfile('.xelatex-stamp'), 'w', encoding='utf-8') as f:
+            f.write(text_type(json.dumps(stamp, indent=1, sort_keys=True)))
+
+    def remove_stamp(self):
+        try:
+            os.remove(self.jobfile('.xelatex-stamp'))
+        except OSError:
+            pass
+
+    def recorded_inputs(self):
+        u"""Return the inputs of the TeX run (relative to the working folder),
+        recorded in the ``.fls`` file.
+
+        Files outside of the working folder (the TeX distribution) and files
+        generated by the job itself are not taken into account."""
+        inputs = set([self.texfile])
+        cwd    = path.abspath(self.cwd)
+        try:
+            with io.open(self.jobfile('.fls'), encoding='utf-8'
+                         , errors='replace') as fls:
+                for line in fls:
+                    if not line.startswith('INPUT '):
+                        continue
+                    fname = path.normpath(path.join(cwd, line[6:].strip()))
+                    if not fname.startswith(cwd + os.sep):
+                        continue
+                    fname = path.relpath(fname, cwd)
+                    base, ext = path.splitext(fname)
+                    if base == self.jobname and ext in GENERATED_EXTENSIONS:
+                        continue
+                    inputs.add(fname)
+        except (IOError, OSError):
+            pass
+        return inputs
+
+    def input_digests(self, inputs):
+        return dict([(fname, file_digest(path.join(self.cwd, fname)))
+                     for fname in inputs])
+
+    def is_uptodate(self, stamp):
+        u"""True if the product (PDF) exists and the inputs are unchanged since
+        the last successful build."""
+        inputs = stamp.get('inputs')
+        if not inputs or self.texfile not in inputs:
+            return False
+        if not path.exists(self.jobfile(self.product)):
+            return False
+        return self.input_digests(inputs) == inputs
+
+    # run
+    # ---
+
+    def run(self, linefunc=None):
+        u"""Compile the TeX file and return the status record (a dict)."""
+        start  = time.time()
+        stamp  = self.read_stamp()
+        result = dict(texfile = self.texfile, returncode = 0, passes = 0
+                      , index = 0)
+
+        if self.is_uptodate(stamp):
+            result.update(status = 'uptodate', duration = 0.0)
+            return result
+
+        self.remove_stamp()
+        idx_digest = stamp.get('idx')
+        digests    = self.aux_digests()
+        returncode = 0
+        rerun      = True
+
+        while result['passes'] < self.max_passes:
+            result['passes'] += 1
+            logparser  = TeXLogParser()
+            returncode = self.execute(self.argv(), linefunc, logparser)
+            result['diagnostics'] = logparser.result()
+            if returncode != 0:
+                break
+            prev, digests = digests, self.aux_digests()
+
+            rerun = prev != digests or logparser.rerun
+            if self.max_passes == 1:
+                # the engine does the reruns by itself (e.g. latexmk), the
+                # auxiliary files of its first pass are always new: only a
+                # rerun request of its last pass is taken
+                rerun = logparser.rerun
+            if (self.index_command and digests['.idx'] is not None
+                and (digests['.idx'] != idx_digest
+                     or not path.exists(self.jobfile('.ind')))):
+                result['index'] += 1
+                returncode = self.execute(
+                    self.argv(self.index_command), linefunc)
+                if returncode != 0:
+                    break
+                idx_digest = digests['.idx']
+                rerun = True
+            if not rerun:
+                break
+
+        result.update(
+            returncode = returncode
+            , status   = 'ok' if returncode == 0 else 'failed'
+            , stable   = not rerun
+            , duration = round(time.time() - start, 3))
+
+        if returncode == 0:
+            self.write_stamp(dict(
+                inputs = self.input_digests(self.recorded_inputs())
+                , idx  = idx_digest))
+        return result
+
+# ==============================================================================
+class TeXCompiler(object):
+# ==============================================================================
+
+    u"""Run a set of :py:class:`CompileJob` in a bounded pool of processes.
+
+    :param int jobs: Maximal number of TeX engines running at the same time.
+
+    :param linefunc: Callback ``linefunc(job, line)``, called for each line of
+        output of the TeX engines.  Callbacks are serialized by a lock.
+    """
+
+    def __init__(self, jobs=1, linefunc=None):
+        self.jobs     = max(1, jobs or 1)
+        self.linefunc = linefunc
+        self.queue    = []
+        self._lock    = threading.Lock()
+
+    def add(self, job):
+        self.queue.append(job)
+
+    def _linefunc(self, job, line):
+        if self.linefunc is not None:
+            with self._lock:
+                self.linefunc(job, line)
+
+    def run(self):
+        u"""Run all jobs, return a dictionary with the status records of the
+        jobs (by texfile)."""
+
+        results = dict()
+        pending = queue.Queue()
+        # schedule the most expensive jobs first
+        for job in sorted(self.queue, key=lambda job: -job.cost):
+            pending.put(job)
+        self.queue = []
+
+        def worker():
+            while True:
+                try:
+                    job = pending.get_nowait()
+                except queue.Empty:
+                    return
+                try:
+                    results[job.texfile] = job.run(self._linefunc)
+                except Exception as exc:  # pylint: disable=W0703
+                    results[job.texfile] = dict(
+                        texfile = job.texfile, returncode = None
+                        , status = 'failed', error = str(exc))
+
+        threads = [threading.Thread(target=worker)
+                   for _ in range(min(self.jobs, pending.qsize()))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+# ==============================================================================
+def engine_env():
+# ==============================================================================
+
+    u"""Return the environment of the TeX engine's processes."""
+
+    env = dict(os.environ)
+    if env.get('SOURCE_DATE_EPOCH'):
+        env.setdefault('FORCE_SOURCE_DATE', '1')
+    return env
+
+# ==============================================================================
+def cpu_count():
+# ==============================================================================
+
+    try:
+        return os.cpu_count() or 1
+    except AttributeError:  # python 2
+        import multiprocessing
+        return multiprocessing.cpu_count()
@@ -0,0 +1,47 @@
+# -*- coding: utf-8; mode: python -*-
+# pylint: disable=C0330
+
+u"""
+    xelatex_ext.builders.fingerprint
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Content hashes (fingerprints) of files and data.
+
+    :copyright:  Copyright (C) 2016 Markus Heiser
+    :license:    GPL V3.0, see LICENSE for details.
+"""
+
+# ==============================================================================
+#  imports
+# ==============================================================================
+
+import hashlib
+import json
+
+from six import text_type
+
+# ==============================================================================
+def file_digest(fname, blocksize=1 << 16):
+# ==============================================================================
+
+    u"""Return the SHA1 hex digest of file *fname* or ``None`` if the file does
+    not exists."""
+
+    sha = hashlib.sha1()
+    try:
+        with open(fname, 'rb') as f:
+            for block in iter(lambda: f.read(blocksize), b''):
+                sha.update(block)
+    except (IOError, OSError):
+        return None
+    return sha.hexdigest()
+
+# ==============================================================================
+def data_digest(data):
+# ==============================================================================
+
+    u"""Return the SHA1 hex digest of *data* (JSON serializable, objects which
+    are not serializable are taken by their text)."""
+
+    dump = json.dumps(data, sort_keys=True, default=text_type)
+    return hashlib.sha1(dump.encode('utf-8')).hexdigest()
@@ -0,0 +1,142 @@
+# -*- coding: utf-8; mode: python -*-
+# pylint: disable=C0330
+
+u"""
+    xelatex_ext.builders.fragcache
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Cache of translated TeX fragments.
+
+    :copyright:  Copyright (C) 2016 Markus Heiser
+    :license:    GPL V3.0, see LICENSE for details.
+
+    Documents like licences or a glossary are inlined into many targets.  The
+    :py:class:`FragmentCache` holds the TeX output of each translated
+    ``start_of_file`` subtree, the XeLaTeX translator reuses it, if the same
+    subtree is translated again with the same settings (see
+    :py:meth:`XeLaTeXTranslator.fragment_key`).  The entries are kept in memory
+    and (to reuse them in the next build) in a folder below the doctree folder.
+    The cache is opt-in:
+
+    .. code-block:: python
+
+        # conf.py
+
+        xelatex_fragment_cache      = True
+        xelatex_fragment_cache_size = 64 * 1024**2   # 64 MiB
+
+    Only the *max_entries* most recently used entries are kept in memory.  The
+    size of the folder is limited by :py:meth:`FragmentCache.evict` (called at
+    the end of the build), the least recently used entries are dropped.
+"""
+
+# ==============================================================================
+#  imports
+# ==============================================================================
+
+import os
+import pickle
+import time
+
+from collections import OrderedDict
+from os import path
+
+# ==============================================================================
+class FragmentCache(object):
+# ==============================================================================
+
+    u"""Cache of translated fragments.
+
+    :param str folder: Folder of the persistent entries, if ``None``, the
+        entries are only kept in memory.
+    :param int max_entries: Maximal number of entries kept in memory.
+
+    :ivar int hits: Number of cache hits.
+    :ivar int misses: Number of cache misses.
+    """
+
+    def __init__(self, folder=None, max_entries=64):
+        self.folder      = folder
+        self.max_entries = max_entries
+        self.entries     = OrderedDict()
+        self.hits        = 0
+        self.misses      = 0
+
+    def fname(self, key):
+        return path.join(self.folder, key + '.pickle')
+
+    def _remember(self, key, entry):
+        # keep *key* as the most recently used entry in memory
+        self.entries.pop(key, None)
+        self.entries[key] = entry
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def get(self, key):
+        u"""Return the entry of *key* or ``None``."""
+        entry = self.entries.get(key)
+        if entry is None and self.folder is not None:
+            try:
+                with open(self.fname(key), 'rb') as f:
+                    entry = pickle.load(f)
+                # mark the entry as used (LRU)
+                os.utime(self.fname(key), None)
+            except (IOError, OSError, EOFError, pickle.UnpicklingError):
+                entry = None
+        if entry is None:
+            self.misses += 1
+        else:
+            self._remember(key, entry)
+            self.hits += 1
+        return entry
+
+    def set(self, key, entry):
+        self._remember(key, entry)
+        if self.folder is None:
+            return
+        if not path.isdir(self.folder):
+            try:
+                os.makedirs(self.folder)
+            except OSError:  # created by a parallel process
+                pass
+        # write to a temporary file and rename, the entry is read by parallel
+        # processes
+        tmp = self.fname(key) + '.%s' % os.getpid()
+        with open(tmp, 'wb') as f:
+            pickle.dump(entry, f, 2)
+        os.rename(tmp, self.fname(key))
+
+    def evict(self, max_size, max_age=3600):
+        u"""Drop the *least recently used* entries of the folder until its size
+        is below *max_size* (bytes).  Temporary files older than *max_age*
+        seconds (left by aborted builds) are removed."""
+        if self.folder is None or not path.isdir(self.folder):
+            return
+        entries = []
+        for fname in os.listdir(self.folder):
+            fname = path.join(self.folder, fname)
+            try:
+                stat = os.stat(fname)
+            except OSError:  # removed by a parallel process
+                continue
+            if not fname.endswith('.pickle'):
+                if stat.st_mtime < time.time() - max_age:
+                    self._remove(fname)
+                continue
+            entries.append((stat.st_mtime, stat.st_size, fname))
+        entries.sort()
+        total = sum([size for _, size, _ in entries])
+        while entries and total > max_size:
+            _, size, fname = entries.pop(0)
+            self._remove(fname)
+            total -= size
+
+    @staticmethod
+    def _remove(fname):
+        try:
+            os.remove(fname)
+        except OSError:
+            pass
+
+    def stats(self):
+        return dict(hits = self.hits, misses = self.misses)
@@ -0,0 +1,188 @@
+# -*- coding: utf-8; mode: python -*-
+# pylint: disable=C0330
+
+u"""
+    xelatex_ext.builders.imageconv
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Conversion and downsampling of images.
+
+    :copyright:  Copyright (C) 2016 Markus Heiser
+    :license:    GPL V3.0, see LICENSE for details.
+
+    Images which can't be embedded by XeTeX are converted and oversized raster
+    images are downsampled to the resolution of the target (``image_dpi``):
+
+    * GIF is converted to PNG (requires `Pillow
+      <https://pypi.python.org/pypi/Pillow>`_)
+    * SVG is converted to PDF (requires `CairoSVG
+      <https://pypi.python.org/pypi/CairoSVG>`_)
+    * PNG and JPEG are downsampled (requires Pillow)
+
+    The libraries are optional, without them, the images are used as they are
+    (a GIF image is embedded unconverted, the builder warns about it).
+    The results are stored in a content-addressed cache (the key is a digest of
+    the image file and the operation), the pending conversions are run by a
+    pool of processes.  The natural size of a downsampled image is kept (its
+    resolution is raised).
+"""
+
+# ==============================================================================
+#  imports
+# ==============================================================================
+
+import os
+
+from multiprocessing import Pool
+from os import path
+
+from xelatex_ext import __version__
+from xelatex_ext.builders.fingerprint import data_digest, file_digest
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+try:
+    import cairosvg
+except ImportError:
+    cairosvg = None
+
+CONVERTED_IMAGE_TYPES = cairosvg and ['image/svg+xml'] or []
+u"""Image types, which are not supported by XeTeX, but can be converted."""
+
+# ==============================================================================
+def conversion(fname, info, dpi=None, max_width=None):
+# ==============================================================================
+
+    u"""Return the operation needed to embed image file *fname* or ``None``.
+
+    :param dict info: Metadata of the image (see
+        :py:func:`xelatex_ext.builders.imageinfo.read_imageinfo`).
+    :param int dpi: Maximal resolution, if ``None`` images are not downsampled.
+    :param float max_width: Maximal width (inch) of an image in the output.
+
+    The operation is a dictionary with the ``format`` of the output and
+    optional the new ``size`` and ``dpi``."""
+
+    ext = path.splitext(fname)[1][1:].lower()
+    if ext == 'svg':
+        return cairosvg and dict(format = 'pdf') or None
+    if ext not in ('gif', 'png', 'jpg', 'jpeg') or Image is None:
+        return None
+    retVal = None
+    if ext == 'gif':
+        retVal = dict(format = 'png')
+    if dpi and info and info['size']:
+        # the image is rendered with its natural size, but not wider than
+        # max_width
+        width, height = info['size']
+        llx, lly, urx, ury = info['bbox']
+        inch = (urx - llx) / 72.0
+        if max_width:
+            inch = min(inch, max_width)
+        scale = float(dpi) * inch / width
+        if scale < 1.0:
+            retVal = retVal or dict(format = ext == 'jpg' and 'jpeg' or ext)
+            retVal['size'] = [max(int(round(width * scale)), 1)
+                              , max(int(round(height * scale)), 1)]
+            # raise the resolution, the natural size (bbox) is kept
+            retVal['dpi'] = [round(72.0 * retVal['size'][0] / (urx - llx), 2)
+                             , round(72.0 * retVal['size'][1] / (ury - lly), 2)]
+    return retVal
+
+# ==============================================================================
+def missing_converter(fname):
+# ==============================================================================
+
+    u"""Return the name of the library needed to embed image file *fname*, if
+    the library is not installed, otherwise ``None``."""
+
+    ext = path.splitext(fname)[1][1:].lower()
+    if ext == 'gif' and Image is None:
+        return 'Pillow'
+    return None
+
+# ==============================================================================
+def convert(src, dst, operation):
+# ==============================================================================
+
+    u"""Convert image file *src* by *operation* (see :py:func:`conversion`) to
+    file *dst*.  Runs in the processes of the pool, returns ``(dst, error)``."""
+
+    tmp = dst + '.%s.tmp' % os.getpid()
+    try:
+        if operation['format'] == 'pdf':
+            cairosvg.svg2pdf(url=src, write_to=tmp)
+        else:
+            img = Image.open(src)
+            if operation.get('size'):
+                if img.mode == 'P':
+                    img = img.convert('RGBA')
+                img = img.resize(tuple(operation['size']), Image.LANCZOS)
+            if operation['format'] == 'jpeg' and img.mode not in ('RGB', 'L'):
+                img = img.convert('RGB')
+            kwargs = dict()
+            if operation.get('dpi'):
+                kwargs['dpi'] = tuple(operation['dpi'])
+            img.save(tmp, operation['format'].upper(), **kwargs)
+        os.rename(tmp, dst)
+    except Exception as exc:  # pylint: disable=W0703
+        if path.exists(tmp):
+            os.remove(tmp)
+        return dst, '%s: %s' % (src, exc)
+    return dst, None
+
+def _convert(args):
+    # Pool.map passes one argument
+    return convert(*args)
+
+# ==============================================================================
+class ImageConverter(object):
+# ==============================================================================
+
+    u"""Cache of the converted images.
+
+    :param str folder: Folder of the cache.
+    :param int jobs: Number of processes converting the images.
+    """
+
+    def __init__(self, folder, jobs=1):
+        self.folder  = folder
+        self.jobs    = jobs
+
+    def cached(self, src, operation):
+        u"""Return the name of the converted file *src* in the cache."""
+        key = data_digest([file_digest(src), operation, __version__])
+        return path.join(self.folder, key + '.' + operation['format'])
+
+    def run(self, conversions):
+        u"""Convert the images (if not cached).
+
+        :param dict conversions: The ``(src, operation)`` tuple of each
+            converted image.
+        :return: ``(converted, errors)``, a dictionary with the name of the
+            file in the cache of each converted image and a list of errors.
+        """
+        converted = dict()
+        pending   = []
+        for name, (src, operation) in sorted(conversions.items()):
+            dst = self.cached(src, operation)
+            converted[name] = dst
+            if not path.exists(dst) and (src, dst, operation) not in pending:
+                pending.append((src, dst, operation))
+        if pending and not path.isdir(self.folder):
+            os.makedirs(self.folder)
+
+        if self.jobs > 1 and len(pending) > 1:
+            pool = Pool(min(self.jobs, len(pending)))
+            try:
+                results = pool.map(_convert, pending)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            results = [convert(*args) for args in pending]
+        errors = [error for _, error in results if error is not None]
+        return converted, errors
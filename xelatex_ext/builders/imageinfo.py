@@ -0,0 +1,304 @@
+# -*- coding: utf-8; mode: python -*-
+# pylint: disable=C0330
+
+u"""
+    xelatex_ext.builders.imageinfo
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Image metadata from the file headers.
+
+    :copyright:  Copyright (C) 2016 Markus Heiser
+    :license:    GPL V3.0, see LICENSE for details.
+
+    The natural size of the images (``supported_image_types`` of the XeLaTeX
+    builder) is read from the file headers, the image data is never decoded:
+
+    * PNG: ``IHDR`` and ``pHYs`` chunks
+    * JPEG: ``SOF`` and ``JFIF`` (``APP0``) segments
+    * GIF: logical screen descriptor
+    * PDF: ``CropBox`` or ``MediaBox`` of the (first) page
+    * SVG: ``width`` and ``height`` (or ``viewBox``) of the root element
+
+    Raster images without a resolution are taken with 72 dpi, as XeTeX does.
+    The :py:class:`ImageInfo` index caches the results by path and modification
+    time, the index is stored below the doctree folder.
+"""
+
+# ==============================================================================
+#  imports
+# ==============================================================================
+
+import os
+import pickle
+import re
+import struct
+
+from os import path
+
+from xelatex_ext.builders.fingerprint import file_digest
+
+# ==============================================================================
+#  module constants
+# ==============================================================================
+
+DEFAULT_DPI = 72
+u"""Resolution of raster images without resolution (the default of XeTeX)."""
+
+PDF_BOX   = re.compile(
+    br'/(CropBox|MediaBox)\s*\[\s*([-0-9.]+)\s+([-0-9.]+)\s+([-0-9.]+)\s+([-0-9.]+)\s*\]')
+PDF_PAGE  = re.compile(br'/Type\s*/Page(?![A-Za-z])')
+PDF_CHUNK = 64 * 1024
+PDF_TAIL  = 4096
+
+SVG_ROOT    = re.compile(br'<svg\b[^>]*>', re.S)
+SVG_LENGTH  = br'\s%s\s*=\s*["\']\s*([0-9.]+)\s*([a-z%%]*)\s*["\']'
+SVG_VIEWBOX = re.compile(
+    br'\sviewBox\s*=\s*["\']\s*[-0-9.]+[\s,]+[-0-9.]+[\s,]+([0-9.]+)[\s,]+([0-9.]+)')
+SVG_UNITS   = {  # big points per unit (pixels with 96 dpi)
+    b'': 0.75, b'px': 0.75, b'pt': 1.0, b'pc': 12.0, b'in': 72.0
+    , b'mm': 72.0 / 25.4, b'cm': 72.0 / 2.54 }
+
+# ==============================================================================
+def bbox(width, height, dpi):
+# ==============================================================================
+
+    u"""Return the bounding box (in big points) of a raster image of *width*
+    x *height* pixels with the resolution *dpi* (x, y)."""
+
+    return [0, 0
+            , round(width * 72.0 / (dpi[0] or DEFAULT_DPI), 2)
+            , round(height * 72.0 / (dpi[1] or DEFAULT_DPI), 2)]
+
+# ==============================================================================
+def read_png(f):
+# ==============================================================================
+
+    head = f.read(24)
+    if head[:8] != b'\x89PNG\r\n\x1a\n' or head[12:16] != b'IHDR':
+        return None
+    width, height = struct.unpack('>II', head[16:24])
+    dpi = (0, 0)
+    f.seek(9, os.SEEK_CUR)  # rest of IHDR and its CRC
+    while True:
+        chunk = f.read(8)
+        if len(chunk) < 8:
+            break
+        length, ctype = struct.unpack('>I4s', chunk)
+        if ctype in (b'IDAT', b'IEND'):
+            break
+        if ctype == b'pHYs':
+            ppux, ppuy, unit = struct.unpack('>IIB', f.read(9))
+            if unit == 1:  # pixels per meter
+                dpi = (int(round(ppux * 0.0254)), int(round(ppuy * 0.0254)))
+            break
+        f.seek(length + 4, os.SEEK_CUR)
+    return dict(size = [width, height], dpi = list(dpi)
+                , bbox = bbox(width, height, dpi))
+
+# ==============================================================================
+def read_jpeg(f):
+# ==============================================================================
+
+    if f.read(2) != b'\xff\xd8':
+        return None
+    dpi = (0, 0)
+    while True:
+        marker = f.read(2)
+        while marker[:1] == b'\xff' and marker[1:2] == b'\xff':  # fill bytes
+            marker = marker[1:] + f.read(1)
+        if len(marker) < 2 or marker[:1] != b'\xff':
+            return None
+        code = ord(marker[1:2])
+        if code in (0xd8, 0x01) or 0xd0 <= code <= 0xd7:  # no segment
+            continue
+        length = struct.unpack('>H', f.read(2))[0]
+        if code == 0xe0:
+            data = f.read(length - 2)
+            if data[:5] == b'JFIF\x00' and len(data) >= 12:
+                unit, xdens, ydens = struct.unpack('>BHH', data[7:12])
+                if unit == 1:    # dots per inch
+                    dpi = (xdens, ydens)
+                elif unit == 2:  # dots per cm
+                    dpi = (int(round(xdens * 2.54)), int(round(ydens * 2.54)))
+            continue
+        if 0xc0 <= code <= 0xcf and code not in (0xc4, 0xc8, 0xcc):
+            height, width = struct.unpack('>xHH', f.read(5))
+            return dict(size = [width, height], dpi = list(dpi)
+                        , bbox = bbox(width, height, dpi))
+        f.seek(length - 2, os.SEEK_CUR)
+
+# ==============================================================================
+def read_gif(f):
+# ==============================================================================
+
+    head = f.read(10)
+    if head[:6] not in (b'GIF87a', b'GIF89a'):
+        return None
+    width, height = struct.unpack('<HH', head[6:10])
+    return dict(size = [width, height], dpi = [0, 0]
+                , bbox = bbox(width, height, (0, 0)))
+
+# ==============================================================================
+def pdf_box(data):
+# ==============================================================================
+
+    # the CropBox (or the MediaBox) in *data* or None
+    boxes = dict()
+    for match in PDF_BOX.finditer(data):
+        boxes.setdefault(match.group(1), [float(x) for x in match.groups()[1:]])
+    return boxes.get(b'CropBox') or boxes.get(b'MediaBox')
+
+# ==============================================================================
+def read_pdf(f):
+# ==============================================================================
+
+    if f.read(5) != b'%PDF-':
+        return None
+    # XeTeX includes the first page: the file is read in chunks up to the end
+    # of the first page object, the box of this page is taken.  A page without
+    # a box inherits the box of its page tree (the first box outside of the
+    # page object).
+    data      = b''
+    inherited = None
+    while True:
+        chunk = f.read(PDF_CHUNK)
+        data += chunk
+        page  = PDF_PAGE.search(data)
+        if page is not None:
+            end = data.find(b'endobj', page.end())
+            if end < 0 and chunk:
+                # the page object is split by the chunk boundary
+                continue
+            start = max(data.rfind(b' obj', 0, page.start()), 0)
+            end   = len(data) if end < 0 else end
+            box   = (pdf_box(data[start:end]) or inherited
+                     or pdf_box(data[:start]) or pdf_box(data[end:]))
+            break
+        if not chunk:
+            # no page object (e.g. in a compressed object stream)
+            box = inherited
+            break
+        inherited = inherited or pdf_box(data)
+        data = data[-PDF_TAIL:]
+    if box is None:
+        return None
+    return dict(size = None, dpi = None, bbox = box)
+
+# ==============================================================================
+def read_svg(f):
+# ==============================================================================
+
+    match = SVG_ROOT.search(f.read(PDF_CHUNK))
+    if match is None:
+        return None
+    root = match.group(0)
+    size = []
+    for name in (b'width', b'height'):
+        length = re.search(SVG_LENGTH % name, root)
+        if length is None or length.group(2) not in SVG_UNITS:
+            size = None
+            break
+        size.append(float(length.group(1)) * SVG_UNITS[length.group(2)])
+    if size is None:
+        viewbox = SVG_VIEWBOX.search(root)
+        if viewbox is None:
+            return None
+        size = [float(x) * SVG_UNITS[b'px'] for x in viewbox.groups()]
+    return dict(size = None, dpi = None
+                , bbox = [0, 0, round(size[0], 2), round(size[1], 2)])
+
+READERS = dict(
+    png    = read_png
+    , jpg  = read_jpeg
+    , jpeg = read_jpeg
+    , gif  = read_gif
+    , pdf  = read_pdf
+    , svg  = read_svg )
+
+# ==============================================================================
+def read_imageinfo(fname):
+# ==============================================================================
+
+    u"""Return the image metadata of file *fname* or ``None`` if the format is
+    unknown or the header is broken.
+
+    The metadata is a dictionary with the ``size`` (pixels), the ``dpi`` and
+    the ``bbox`` (big points, ``[llx, lly, urx, ury]``)."""
+
+    reader = READERS.get(path.splitext(fname)[1][1:].lower())
+    if reader is None:
+        return None
+    try:
+        with open(fname, 'rb') as f:
+            return reader(f)
+    except (IOError, OSError, struct.error, ValueError):
+        return None
+
+# ==============================================================================
+class ImageInfo(object):
+# ==============================================================================
+
+    u"""Index of the image metadata (see :py:func:`read_imageinfo`).
+
+    :param str fname: File of the persistent index, if ``None``, the index is
+        only kept in memory.
+
+    The entries are cached by the path and the modification time of the image
+    file.
+    """
+
+    def __init__(self, fname=None):
+        self.fname   = fname
+        self.entries = dict()
+        self.digests = dict()
+        self.changed = False
+        if fname is not None:
+            try:
+                with open(fname, 'rb') as f:
+                    self.entries = pickle.load(f)
+            except (IOError, OSError, EOFError, pickle.UnpicklingError):
+                pass
+
+    def get(self, fname):
+        u"""Return the metadata of image file *fname* or ``None``."""
+        fname = path.abspath(fname)
+        try:
+            stat = os.stat(fname)
+        except OSError:
+            return None
+        stamp = (stat.st_mtime, stat.st_size)
+        entry = self.entries.get(fname)
+        if entry is None or entry[0] != stamp:
+            entry = (stamp, read_imageinfo(fname))
+            self.entries[fname] = entry
+            self.changed = True
+        return entry[1]
+
+    def digest(self, fname):
+        u"""Return the content digest of image file *fname* or ``None``, the
+        digests are cached (in memory) by the modification time."""
+        fname = path.abspath(fname)
+        try:
+            stat = os.stat(fname)
+        except OSError:
+            return None
+        stamp = (stat.st_mtime, stat.st_size)
+        entry = self.digests.get(fname)
+        if entry is None or entry[0] != stamp:
+            entry = (stamp, file_digest(fname))
+            self.digests[fname] = entry
+        return entry[1]
+
+    def update(self, fnames):
+        u"""Read the metadata of the image files *fnames* (if not cached)."""
+        for fname in fnames:
+            self.get(fname)
+
+    def save(self):
+        if self.fname is None or not self.changed:
+            return
+        tmp = self.fname + '.%s' % os.getpid()
+        with open(tmp, 'wb') as f:
+            pickle.dump(self.entries, f, 2)
+        os.rename(tmp, self.fname)
+        self.changed = False
@@ -0,0 +1,88 @@
+# -*- coding: utf-8; mode: python -*-
+# pylint: disable=C0330
+
+u"""
+    xelatex_ext.builders.journal
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Journal of the written targets, to resume an interrupted build.
+
+    :copyright:  Copyright (C) 2016 Markus Heiser
+    :license:    GPL V3.0, see LICENSE for details.
+
+    With ``xelatex_resume``, each written target is recorded in the
+    :py:class:`BuildJournal` (``xelatex-journal.json`` in the output folder)
+    with its fingerprint (see :py:meth:`XeLaTeXBuilder.target_fingerprint`) and
+    its images, as soon as it has been written.  If such a build stops (e.g. a
+    target raises), the next build with ``xelatex_resume`` skips the targets of
+    the journal whose inputs are unchanged.  Without ``xelatex_resume``, no
+    fingerprints are computed and the journal is cleared:
+
+    .. code-block:: bash
+
+        sphinx-build -b xelatex -D xelatex_resume=1 . _build/xelatex
+"""
+
+# ==============================================================================
+#  imports
+# ==============================================================================
+
+import json
+import os
+
+from os import path
+
+from six import text_type
+
+from xelatex_ext.builders.outfile import write_text_if_changed
+
+# ==============================================================================
+class BuildJournal(object):
+# ==============================================================================
+
+    u"""Written targets of the build.
+
+    :param str fname: JSON file of the journal.
+
+    :ivar dict targets: The ``fingerprint``, ``images`` and ``conversions`` of
+        each written target.
+    """
+
+    def __init__(self, fname):
+        self.fname   = fname
+        self.targets = dict()
+        if path.exists(fname):
+            try:
+                with open(fname) as f:
+                    self.targets = json.load(f)
+            except (IOError, ValueError):
+                # a damaged journal resumes nothing
+                pass
+
+    def get(self, targetname, fingerprint):
+        u"""Return the entry of target *targetname*, if it has been written with
+        *fingerprint*, otherwise ``None``."""
+        entry = self.targets.get(targetname)
+        if entry is not None and entry['fingerprint'] == fingerprint:
+            return entry
+        return None
+
+    def record(self, targetname, fingerprint, images, conversions):
+        u"""Record the written target *targetname* (the journal is saved
+        immediately)."""
+        self.targets[targetname] = dict(
+            fingerprint = fingerprint, images = images
+            , conversions = conversions)
+        self.save()
+
+    def clear(self):
+        u"""Drop all entries, the file of the journal is removed."""
+        self.targets = dict()
+        try:
+            os.remove(self.fname)
+        except OSError:
+            pass
+
+    def save(self):
+        write_text_if_changed(self.fname, text_type(
+            json.dumps(self.targets, indent=1, sort_keys=True)))
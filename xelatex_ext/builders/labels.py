@@ -0,0 +1,97 @@
+# -*- coding: utf-8; mode: python -*-
+# pylint: disable=C0330
+
+u"""
+    xelatex_ext.builders.labels
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Index of the labels over all XeLaTeX targets.
+
+    :copyright:  Copyright (C) 2016 Markus Heiser
+    :license:    GPL V3.0, see LICENSE for details.
+
+    The :py:class:`LabelIndex` maps each document to the target which includes
+    it and each label (``.. _label:``) to its target and its anchor in the
+    target (the ``\\label`` of the TeX output).  It is built once per build,
+    references into other targets are resolved by it (see
+    :py:meth:`XeLaTeXBuilder.get_target_uri`) and it is dumped to
+    ``xelatex-labels.json`` in the output folder (e.g. for tools linking into
+    the PDFs).
+"""
+
+# ==============================================================================
+#  imports
+# ==============================================================================
+
+import json
+
+from six import iteritems, text_type
+
+from xelatex_ext.builders.fingerprint import data_digest
+from xelatex_ext.builders.outfile import write_text_if_changed
+
+# ==============================================================================
+class LabelIndex(object):
+# ==============================================================================
+
+    u"""Index of the labels and documents of the targets.
+
+    :ivar dict targets: The targetname of each docname.  A document included
+        in more than one target is mapped to the first of them (in the order
+        of ``xelatex_documents``).
+    :ivar dict labels: The ``(targetname, docname, anchor, sectname)`` of each
+        label.
+    :ivar dict jobnames: The name of the TeX job of each target.
+    """
+
+    def __init__(self):
+        self.targets  = dict()
+        self.labels   = dict()
+        self.jobnames = dict()
+
+    def build(self, docset, target_docnames, std_labels, jobname):
+        u"""(Re-) build the index.
+
+        :param XeLaTeXDocSet docset: The targets.
+        :param target_docnames: Function returning the docnames of a target.
+        :param dict std_labels: The labels of the ``std`` domain.
+        :param jobname: Function returning the name of the TeX job of a target.
+        """
+        self.targets  = dict()
+        self.labels   = dict()
+        self.jobnames = dict()
+        for docCfg in docset.docs:
+            self.jobnames[docCfg.targetname] = jobname(docCfg)
+            for docname in sorted(target_docnames(docCfg)):
+                self.targets.setdefault(docname, docCfg.targetname)
+        for label, (docname, labelid, sectname) in iteritems(std_labels):
+            targetname = self.targets.get(docname)
+            if targetname is not None:
+                self.labels[label] = (
+                    targetname, docname, '%s:%s' % (docname, labelid), sectname)
+
+    def target(self, docname):
+        u"""Return the targetname of document *docname* or ``None``."""
+        return self.targets.get(docname)
+
+    def jobname(self, docname):
+        u"""Return the name of the TeX job of the target including document
+        *docname* or ``None``."""
+        return self.jobnames.get(self.targets.get(docname))
+
+    def lookup(self, label):
+        u"""Return the ``(targetname, docname, anchor, sectname)`` of *label* or
+        ``None``."""
+        return self.labels.get(label)
+
+    def digest(self):
+        return data_digest(self.targets)
+
+    def dump(self, fname):
+        data = dict([
+            (label, dict(target=target, docname=docname, anchor=anchor
+                         , title=sectname))
+            for label, (target, docname, anchor, sectname)
+            in iteritems(self.labels)])
+        write_text_if_changed(
+            fname, text_type(json.dumps(data, indent=1, sort_keys=True)))
@@ -0,0 +1,161 @@
+# -*- coding: utf-8; mode: python -*-
+# pylint: disable=C0330
+
+u"""
+    xelatex_ext.builders.memory
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Peak-memory accounting of the XeLaTeX builder.
+
+    :copyright:  Copyright (C) 2016 Markus Heiser
+    :license:    GPL V3.0, see LICENSE for details.
+
+    The :py:class:`MemoryProbe` records the *resident set size* (RSS) of the
+    process and the peak of the python allocations (`tracemalloc`_) at the
+    phases of a target's build.  The probe is activated by the
+    ``xelatex_memory_profile`` config value, with python versions lacking the
+    tracemalloc module only the RSS is recorded.
+
+    _`tracemalloc`: https://docs.python.org/3/library/tracemalloc.html
+"""
+
+# ==============================================================================
+#  imports
+# ==============================================================================
+
+import sys
+
+try:
+    import tracemalloc
+except ImportError:  # python < 3.4
+    tracemalloc = None
+
+try:
+    import resource
+except ImportError:  # not available on windows
+    resource = None
+
+# ==============================================================================
+def rss():
+# ==============================================================================
+
+    u"""Return the current *resident set size* (bytes) of this process.
+
+    Returns ``None`` if the RSS can't be determined on this platform."""
+
+    try:
+        with open('/proc/self/statm') as statm:
+            pages = int(statm.read().split()[1])
+        return pages * resource.getpagesize()
+    except (IOError, OSError, IndexError, ValueError, AttributeError):
+        return None
+
+# ==============================================================================
+def uss():
+# ==============================================================================
+
+    u"""Return the current *unique set size* (bytes) of this process.
+
+    The USS are the resident pages private to this process, the pages a forked
+    process shares *copy-on-write* with its parent are not counted.  Returns
+    ``None`` if the USS can't be determined on this platform (it is read from
+    ``/proc/self/smaps_rollup``, Linux 4.14 and later)."""
+
+    try:
+        size = 0
+        with open('/proc/self/smaps_rollup') as smaps:
+            for line in smaps:
+                if line.startswith(('Private_Clean:', 'Private_Dirty:')):
+                    size += int(line.split()[1]) * 1024
+        return size
+    except (IOError, OSError, IndexError, ValueError):
+        return None
+
+# ==============================================================================
+def maxrss():
+# ==============================================================================
+
+    u"""Return the peak *resident set size* (bytes) of this process.
+
+    Returns ``None`` if the peak RSS can't be determined on this platform."""
+
+    if resource is None:
+        return None
+    val = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform != 'darwin':
+        val *= 1024  # Linux & BSD report kilobytes
+    return val
+
+# ==============================================================================
+class MemoryProbe(object):
+# ==============================================================================
+
+    u"""Record memory usage at the phases of a target's build.
+
+    :param bool enabled: A disabled probe records nothing, the calls of
+        :py:meth:`record` are cheap no-ops.
+
+    :param int top: Number of top allocation sites (per phase) put into the
+        result.
+
+    .. code-block:: python
+
+        probe = MemoryProbe(enabled=True)
+        probe.start()
+        ...
+        probe.record("assembled")
+        ...
+        result = probe.stop()
+
+    At each :py:meth:`record` the tracemalloc peak is reset, so the peak of a
+    phase is the peak *since the previous* phase.
+    """
+
+    def __init__(self, enabled=False, top=10):
+        self.enabled  = enabled
+        self.top      = top
+        self.phases   = []
+        self._started = False
+
+    def start(self):
+        self.phases = []
+        if not self.enabled or tracemalloc is None:
+            return
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started = True
+        self._reset_peak()
+
+    def stop(self):
+        u"""Stop tracing and return the recorded phases (a list of dicts)."""
+        if self._started:
+            tracemalloc.stop()
+            self._started = False
+        return self.phases
+
+    def record(self, phase):
+        if not self.enabled:
+            return
+        data = dict(phase = phase, rss = rss(), maxrss = maxrss())
+        if tracemalloc is not None and tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            data.update(traced = current, traced_peak = peak)
+            if self.top:
+                data['top'] = self._top_allocations()
+            self._reset_peak()
+        self.phases.append(data)
+
+    def _top_allocations(self):
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__), ))
+        return [
+            dict(site  = "%s:%s" % (stat.traceback[0].filename
+                                    , stat.traceback[0].lineno)
+                 , size  = stat.size
+                 , count = stat.count)
+            for stat in snapshot.statistics('lineno')[:self.top] ]
+
+    @staticmethod
+    def _reset_peak():
+        if hasattr(tracemalloc, 'reset_peak'):   # python >= 3.9
+            tracemalloc.reset_peak()
@@ -0,0 +1,130 @@
+# -*- coding: utf-8; mode: python -*-
+# pylint: disable=C0330
+
+u"""
+    xelatex_ext.builders.outfile
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Write-if-changed, atomic output of the XeLaTeX builder.
+
+    :copyright:  Copyright (C) 2016 Markus Heiser
+    :license:    GPL V3.0, see LICENSE for details.
+
+    Files in the output folder are only (re-) written, if their content has
+    been changed; so the modification time of unchanged files is kept and
+    downstream tools (``make``, ``latexmk``) do not rerun.  The content is
+    written into a temporary file which is renamed to the destination, an
+    interrupted build never leaves half-written files.
+"""
+
+# ==============================================================================
+#  imports
+# ==============================================================================
+
+import filecmp
+import os
+import shutil
+
+from os import path
+
+# ==============================================================================
+def _tmpname(fname):
+# ==============================================================================
+
+    return path.join(path.dirname(fname)
+                     , '.%s.%s.tmp' % (path.basename(fname), os.getpid()))
+
+# ==============================================================================
+def _replace(tmp, fname):
+# ==============================================================================
+
+    try:
+        os.rename(tmp, fname)
+    except OSError:
+        # on windows, rename does not replace an existing file
+        if not path.exists(fname):
+            raise
+        os.remove(fname)
+        os.rename(tmp, fname)
+
+# ==============================================================================
+def write_if_changed(fname, data):
+# ==============================================================================
+
+    u"""Write *data* (bytes) to file *fname*, if the content of the file
+    differs.  Returns ``True`` if the file has been written."""
+
+    try:
+        if path.getsize(fname) == len(data):
+            with open(fname, 'rb') as f:
+                if f.read() == data:
+                    return False
+    except (IOError, OSError):
+        pass
+    tmp = _tmpname(fname)
+    try:
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        _replace(tmp, fname)
+    finally:
+        if path.exists(tmp):
+            os.remove(tmp)
+    return True
+
+# ==============================================================================
+def write_text_if_changed(fname, text, encoding='utf-8'):
+# ==============================================================================
+
+    u"""Like :py:func:`write_if_changed`, *text* is encoded by *encoding*."""
+
+    return write_if_changed(fname, text.encode(encoding))
+
+# ==============================================================================
+def write_chunks_if_changed(fname, chunks, blocksize=1 << 16):
+# ==============================================================================
+
+    u"""Like :py:func:`write_if_changed`, the content is given by *chunks*, a
+    list of bytes and (binary) file objects, which are copied block by block
+    (the content is never held in memory)."""
+
+    tmp = _tmpname(fname)
+    try:
+        with open(tmp, 'wb') as f:
+            for chunk in chunks:
+                if isinstance(chunk, bytes):
+                    f.write(chunk)
+                else:
+                    shutil.copyfileobj(chunk, f, blocksize)
+        if path.isfile(fname) and filecmp.cmp(tmp, fname, shallow=False):
+            return False
+        _replace(tmp, fname)
+    finally:
+        if path.exists(tmp):
+            os.remove(tmp)
+    return True
+
+# ==============================================================================
+def copy_if_changed(src, dst):
+# ==============================================================================
+
+    u"""Copy file *src* to *dst*, if the content of *dst* differs.  Returns
+    ``True`` if the file has been copied.
+
+    As ``sphinx.util.osutil.copyfile`` does, the modification time of *src* is
+    copied."""
+
+    if path.isfile(dst) and filecmp.cmp(src, dst, shallow=False):
+        return False
+    tmp = _tmpname(dst)
+    try:
+        shutil.copyfile(src, tmp)
+        try:
+            stat = os.stat(src)
+            os.utime(tmp, (stat.st_atime, stat.st_mtime))
+        except OSError:
+            pass
+        _replace(tmp, dst)
+    finally:
+        if path.exists(tmp):
+            os.remove(tmp)
+    return True
@@ -0,0 +1,78 @@
+# -*- coding: utf-8; mode: python -*-
+# pylint: disable=C0330
+
+u"""
+    xelatex_ext.builders.report
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Build report of the XeLaTeX builder.
+
+    :copyright:  Copyright (C) 2016 Markus Heiser
+    :license:    GPL V3.0, see LICENSE for details.
+
+    The :py:class:`BuildReport` collects *per-target* records of a build (e.g.
+    memory usage, compile status, TeX diagnostics) and dumps them into a JSON
+    file in the output folder (see ``xelatex_build_report``).  The records of
+    the whole build (e.g. the schedule of the parallel processes) are added to
+    the pseudo target :py:data:`BUILD`."""
+
+# ==============================================================================
+#  imports
+# ==============================================================================
+
+import json
+
+from six import text_type
+
+from xelatex_ext.builders.outfile import write_text_if_changed
+
+# ==============================================================================
+#  module constants
+# ==============================================================================
+
+BUILD = '*'
+u"""Name of the pseudo target with the records of the whole build."""
+
+# ==============================================================================
+class BuildReport(object):
+# ==============================================================================
+
+    u"""Collect *per-target* sections of a build report.
+
+    A report is a dictionary of targets, each target is a dictionary of
+    sections (e.g. ``memory``).  Reports of (parallel) worker processes are
+    merged into the report of the main process by :py:meth:`update`.
+
+    .. code-block:: python
+
+        report = BuildReport()
+        report.add("my_book-a4", "memory", {"peak": 1024})
+        report.dump("xelatex-report.json")
+    """
+
+    def __init__(self):
+        self.targets = dict()
+
+    def __bool__(self):
+        return bool(self.targets)
+    __nonzero__ = __bool__
+
+    def add(self, targetname, section, data):
+        u"""Add (replace) *section* of target *targetname*."""
+        self.targets.setdefault(targetname, dict())[section] = data
+
+    def get(self, targetname, section, default=None):
+        return self.targets.get(targetname, dict()).get(section, default)
+
+    def update(self, targets):
+        u"""Merge the target sections of an other report (e.g. from a worker)."""
+        for targetname, sections in targets.items():
+            for section, data in sections.items():
+                self.add(targetname, section, data)
+
+    def clear(self):
+        self.targets = dict()
+
+    def dump(self, fname):
+        write_text_if_changed(fname, text_type(json.dumps(
+            self.targets, indent=2, sort_keys=True, ensure_ascii=False)))
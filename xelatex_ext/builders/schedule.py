@@ -0,0 +1,112 @@
+# -*- coding: utf-8; mode: python -*-
+# pylint: disable=C0330
+
+u"""
+    xelatex_ext.builders.schedule
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Scheduling of the targets on the parallel processes.
+
+    :copyright:  Copyright (C) 2016 Markus Heiser
+    :license:    GPL V3.0, see LICENSE for details.
+
+    The duration (and the memory of a fresh parallel process) of each written
+    target is stored in the :py:class:`TargetTimings` (``xelatex-timings.json``
+    in the doctree folder).
+    The next build dispatches the targets *longest processing time* first,
+    each target to the next idle process (see :py:class:`WorkerPool`), the
+    process with the least load.  :py:func:`lpt_schedule` predicts the
+    makespan of this schedule.  The duration of a target without history is
+    estimated by the number of its documents.
+"""
+
+# ==============================================================================
+#  imports
+# ==============================================================================
+
+import json
+
+from os import path
+
+from six import text_type
+
+from xelatex_ext.builders.outfile import write_text_if_changed
+
+# ==============================================================================
+#  module constants
+# ==============================================================================
+
+DOC_SECONDS = 0.5
+u"""Estimated duration (seconds) of a document, if there is no history."""
+
+# ==============================================================================
+class TargetTimings(object):
+# ==============================================================================
+
+    u"""Durations of the targets in previous builds.
+
+    :param str fname: JSON file of the timings.
+
+    :ivar dict timings: The ``[seconds, docs, rss]`` of each target, *rss* is
+        the memory (bytes, the USS) of a fresh parallel process after the
+        target (or ``None``).
+    """
+
+    def __init__(self, fname):
+        self.fname   = fname
+        self.timings = dict()
+        if path.exists(fname):
+            try:
+                with open(fname) as f:
+                    self.timings = json.load(f)
+            except (IOError, ValueError):
+                # a damaged file drops the history
+                pass
+
+    def record(self, targetname, seconds, docs, rss=None):
+        if rss is None:
+            # keep the RSS of a previous parallel build
+            rss = self.rss(targetname)
+        self.timings[targetname] = [round(seconds, 3), docs, rss]
+
+    def rss(self, targetname):
+        u"""Return the recorded RSS of target *targetname* or ``None``."""
+        timing = self.timings.get(targetname)
+        if timing is not None and len(timing) > 2:
+            return timing[2]
+        return None
+
+    def estimate(self, targetname, docs):
+        u"""Return the estimated duration (seconds) of target *targetname* with
+        *docs* documents."""
+        timing = self.timings.get(targetname)
+        if timing is not None:
+            return timing[0]
+        seconds = sum([t[0] for t in self.timings.values()])
+        count   = sum([t[1] for t in self.timings.values()])
+        if count:
+            return docs * seconds / count
+        return docs * DOC_SECONDS
+
+    def save(self):
+        write_text_if_changed(self.fname, text_type(
+            json.dumps(self.timings, indent=1, sort_keys=True)))
+
+# ==============================================================================
+def lpt_schedule(costs, nproc):
+# ==============================================================================
+
+    u"""Distribute the jobs on *nproc* processes, longest processing time first.
+
+    :param dict costs: The estimated duration of each job.
+    :return: ``(queues, loads)``, the jobs and the estimated duration of each
+        process, the makespan of the schedule is ``max(loads)``.
+    """
+
+    queues = [[] for _ in range(nproc)]
+    loads  = [0.0] * nproc
+    for name in sorted(costs, key=lambda name: (-costs[name], name)):
+        idx = loads.index(min(loads))
+        queues[idx].append(name)
+        loads[idx] += costs[name]
+    return queues, loads
@@ -0,0 +1,177 @@
+# -*- coding: utf-8; mode: python -*-
+# pylint: disable=C0330
+
+u"""
+    xelatex_ext.builders.texlog
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Streaming parser of the TeX engine's output.
+
+    :copyright:  Copyright (C) 2016 Markus Heiser
+    :license:    GPL V3.0, see LICENSE for details.
+
+    The :py:class:`TeXLogParser` is fed line by line (e.g. with the output of
+    the engine, while the engine is running).  It collects errors, overfull
+    and underfull boxes, undefined references and citations and the hints to
+    rerun TeX.  The memory used by the parser does not depend on the size of
+    the log: only a limited number of records are kept, all messages are
+    counted.
+
+    The XeLaTeX writer emits a marker (``\\typeout``) at the start and the end
+    of each document (see ``start_of_file`` nodes), the parser uses these
+    markers to map the messages back to the docname of the sphinx source.
+"""
+
+# ==============================================================================
+#  imports
+# ==============================================================================
+
+import re
+
+MARKER = 'xelatex-ext:'
+u"""Prefix of the markers in the TeX output (see :py:func:`marker`)."""
+
+TEX_LINE_LENGTH = 79
+u"""TeX's ``max_print_line``, longer lines are wrapped by TeX."""
+
+# ==============================================================================
+def marker(what, docname):
+# ==============================================================================
+
+    u"""Return the TeX code of a marker, *what* is ``start-of-file`` or
+    ``end-of-file``."""
+
+    return u'\\typeout{%s%s:\\detokenize{%s}}\n' % (MARKER, what, docname)
+
+# ==============================================================================
+class TeXLogParser(object):
+# ==============================================================================
+
+    u"""Incremental parser of the output of a TeX run.
+
+    :param int max_records: Maximal number of records kept by the parser,
+        further messages are only counted.
+
+    .. code-block:: python
+
+        parser = TeXLogParser()
+        for line in tex_output:
+            parser.feed(line)
+        parser.close()
+        diagnostics = parser.result()
+
+    Each record is a dict with the keys ``kind`` (one of the keys in
+    :py:attr:`counts`), ``message``, ``docname`` and ``texline``.
+    """
+
+    kinds = ('error', 'overfull', 'underfull', 'undefined_reference'
+             , 'undefined_citation', 'warning')
+
+    re_error     = re.compile(r'^! (.*)')
+    re_texline   = re.compile(r'^l\.(\d+)')
+    re_box       = re.compile(r'^(Overfull|Underfull) \\[hv]box')
+    re_lines     = re.compile(r' at lines? (\d+)')
+    re_reference = re.compile(r"LaTeX Warning: Reference `(.*?)' on page \d+ undefined(?: on input line (\d+))?")
+    re_citation  = re.compile(r"LaTeX Warning: Citation `(.*?)' on page \d+ undefined(?: on input line (\d+))?")
+    re_warning   = re.compile(r'^(?:LaTeX|Package \S+|Class \S+) Warning: (.*?)(?: on input line (\d+))?\.?$')
+    re_rerun     = re.compile(
+        r'Rerun to get|Label\(s\) may have changed|Rerun LaTeX'
+        r'|Package rerunfilecheck Warning')
+    re_marker    = re.compile(r'^%s(start-of-file|end-of-file):(.*)' % re.escape(MARKER))
+
+    def __init__(self, max_records=200):
+        self.max_records = max_records
+        self.records     = []
+        self.counts      = dict([(kind, 0) for kind in self.kinds])
+        self.rerun       = False
+        self.docstack    = []
+        self._wrapped    = ''
+        self._error      = None   # error record waiting for its "l.<n>" line
+        self._wait       = 0
+
+    @property
+    def docname(self):
+        return self.docstack[-1] if self.docstack else None
+
+    def feed(self, line):
+        u"""Feed one line of TeX output."""
+        line = line.rstrip('\r\n')
+        if len(line) == TEX_LINE_LENGTH and len(self._wrapped) < 16 * TEX_LINE_LENGTH:
+            # TeX has wrapped the line, join with the next one
+            self._wrapped += line
+            return
+        line, self._wrapped = self._wrapped + line, ''
+        self._parse(line)
+
+    def close(self):
+        if self._wrapped:
+            line, self._wrapped = self._wrapped, ''
+            self._parse(line)
+        self._error = None
+
+    def _add(self, kind, message, texline=None):
+        self.counts[kind] += 1
+        record = dict(kind = kind, message = message.strip()
+                      , docname = self.docname
+                      , texline = int(texline) if texline else None)
+        if len(self.records) < self.max_records:
+            self.records.append(record)
+        return record
+
+    def _parse(self, line):
+        match = self.re_marker.match(line)
+        if match:
+            what, docname = match.groups()
+            if what == 'start-of-file':
+                self.docstack.append(docname.strip())
+            elif self.docstack:
+                self.docstack.pop()
+            return
+
+        if self._error is not None:
+            match = self.re_texline.match(line)
+            if match:
+                self._error['texline'] = int(match.group(1))
+                self._error = None
+            else:
+                self._wait -= 1
+                if self._wait <= 0:
+                    self._error = None
+
+        if self.re_rerun.search(line):
+            self.rerun = True
+
+        match = self.re_error.match(line)
+        if match:
+            self._error = self._add('error', match.group(1))
+            self._wait  = 10
+            return
+
+        match = self.re_box.match(line)
+        if match:
+            texline = self.re_lines.search(line)
+            self._add(match.group(1).lower(), line
+                      , texline.group(1) if texline else None)
+            return
+
+        match = self.re_reference.search(line)
+        if match:
+            self._add('undefined_reference', match.group(1), match.group(2))
+            return
+
+        match = self.re_citation.search(line)
+        if match:
+            self._add('undefined_citation', match.group(1), match.group(2))
+            return
+
+        match = self.re_warning.match(line)
+        if match:
+            self._add('warning', match.group(1), match.group(2))
+
+    def result(self):
+        u"""Return the diagnostics (a dict) for the build report."""
+        return dict(
+            counts    = dict(self.counts)
+            , rerun   = self.rerun
+            , records = list(self.records)
+            , dropped = sum(self.counts.values()) - len(self.records))
@@ -0,0 +1,209 @@
+# -*- coding: utf-8; mode: python -*-
+# pylint: disable=C0330
+
+u"""
+    xelatex_ext.builders.workers
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Pool of forked processes writing the XeLaTeX targets.
+
+    :copyright:  Copyright (C) 2016 Markus Heiser
+    :license:    GPL V3.0, see LICENSE for details.
+
+    The processes of the :py:class:`WorkerPool` are forked, when the builder
+    has loaded the environment and its caches (label index, image metadata,
+    ...), the processes share them *copy-on-write*.  Only the names of the
+    jobs (targets) are sent to the processes and only the (small) results of
+    the jobs are sent back (warnings, report, images, messages), no doctree or
+    environment is pickled.  The jobs are dispatched in the given order to the
+    next idle process.
+
+    A process is *recycled* (replaced by a fresh fork) after ``max_jobs`` jobs
+    or if its memory exceeds ``max_rss`` after a job, the memory leaked by the
+    jobs (docutils trees, lexers, ...) is released with the process.  The
+    memory of a process is its *unique set size* (see :py:func:`uss`), the
+    pages shared with the parent are not counted.  Where the USS can't be
+    determined, the growth of the RSS since the fork is taken.  The ``fresh`` jobs (e.g. memory-heavy targets) are run by a fresh
+    process, which is recycled after the job.
+
+    By default the pool *fails fast*: the first job which raises terminates
+    the other processes (the outstanding jobs are canceled).  Otherwise the
+    failed process is replaced and the errors are returned by
+    :py:meth:`WorkerPool.run`.
+"""
+
+# ==============================================================================
+#  imports
+# ==============================================================================
+
+import multiprocessing
+import pickle
+import select
+import traceback
+
+from sphinx.errors import SphinxParallelError
+
+from xelatex_ext.builders.memory import rss, uss
+
+try:
+    _mp = multiprocessing.get_context('fork')
+except (AttributeError, ValueError):  # python < 3.4 or no fork
+    _mp = multiprocessing
+
+# ==============================================================================
+def _work(conn, func):
+# ==============================================================================
+
+    # the loop of a worker process: run the jobs until ``None`` is received
+    baseline = rss() if uss() is None else None
+    def memory():
+        # the memory of this process, without the pages shared copy-on-write
+        # with the parent
+        if baseline is None:
+            return uss()
+        current = rss()
+        return None if current is None else current - baseline
+    while True:
+        job = conn.recv()
+        if job is None:
+            break
+        try:
+            result = func(job)
+            conn.send((job, False, (result, memory())))
+        except BaseException as exc:  # pylint: disable=W0703
+            tb = traceback.format_exc()
+            try:
+                pickle.dumps(exc)
+            except Exception:  # pylint: disable=W0703
+                exc = RuntimeError(repr(exc))
+            conn.send((job, True, (exc, tb)))
+            break
+    conn.close()
+
+# ==============================================================================
+class WorkerPool(object):
+# ==============================================================================
+
+    u"""Forked processes running *func* on jobs.
+
+    :param int nproc: Number of processes.
+    :param func: Function called in the processes with the name of a job, the
+        returned value has to be picklable.
+    :param int max_jobs: Recycle a process after this number of jobs (``0``:
+        unlimited).
+    :param int max_rss: Recycle a process if its memory (bytes, the USS)
+        exceeds this limit after a job (``0``: unlimited).
+    :param fresh: Names of the jobs which are run by a fresh process.
+    :param bool fail_fast: Cancel the outstanding jobs, if a job raises.
+
+    :ivar dict rss: The memory (USS) of a fresh process after the job, for
+        each job which has been run by a fresh process (``None`` if it can't be
+        determined on this platform).  The memory of a process after a later
+        job includes the memory of the jobs before, it is not recorded.
+    :ivar int recycled: Number of the recycled processes.
+
+    .. code-block:: python
+
+        pool = WorkerPool(4, write_target, max_jobs=20)
+        pool.run(['book', 'manual'], lambda job, worker, result: ...)
+    """
+
+    def __init__(self, nproc, func, max_jobs=0, max_rss=0, fresh=()
+                 , fail_fast=True):
+        self.nproc     = nproc
+        self.func      = func
+        self.max_jobs  = max_jobs
+        self.max_rss   = max_rss
+        self.fresh     = set(fresh)
+        self.fail_fast = fail_fast
+        self.workers   = dict()
+        self.rss       = dict()
+        self.recycled  = 0
+
+    def _start(self, worker):
+        conn, child = _mp.Pipe()
+        proc = _mp.Process(target=_work, args=(child, self.func))
+        proc.start()
+        child.close()
+        self.workers[conn] = dict(
+            worker=worker, proc=proc, jobs=0, last=None, rss=None)
+        return conn
+
+    def _stop(self, conn, terminate=False, failed=False):
+        proc = self.workers.pop(conn)['proc']
+        if terminate:
+            proc.terminate()
+        elif not failed:  # a failed process has ended its loop
+            conn.send(None)
+        conn.close()
+        proc.join()
+
+    def _exhausted(self, state, job):
+        # the process has to be recycled before *job*
+        last = state['last']
+        if last is None:
+            return False
+        return bool(
+            job in self.fresh or last in self.fresh
+            or (self.max_jobs and state['jobs'] >= self.max_jobs)
+            or (self.max_rss and (state['rss'] or 0) > self.max_rss))
+
+    def _send(self, conn, job):
+        # send *job* to the process (or to its replacement), returns the
+        # connection of the process
+        state = self.workers[conn]
+        if self._exhausted(state, job):
+            self._stop(conn)
+            self.recycled += 1
+            conn  = self._start(state['worker'])
+            state = self.workers[conn]
+        state['jobs'] += 1
+        state['last']  = job
+        conn.send(job)
+        return conn
+
+    def run(self, jobs, result_func):
+        u"""Run the *jobs* and call ``result_func(job, worker, result)`` (in
+        this process) with the result of each job.
+
+        *worker* is the number of the process which has run the job.  If a job
+        raises (or its process dies), the other processes are terminated and a
+        :py:class:`SphinxParallelError` is raised.  Without ``fail_fast``, the
+        failed process is replaced, the other jobs are run and a list of the
+        ``(job, SphinxParallelError)`` tuples of the failed jobs is returned."""
+        pending = list(jobs)
+        errors  = []
+        try:
+            for worker in range(min(self.nproc, len(pending))):
+                self._send(self._start(worker), pending.pop(0))
+            while self.workers:
+                ready, _, _ = select.select(list(self.workers), [], [])
+                for conn in ready:
+                    state  = self.workers[conn]
+                    worker = state['worker']
+                    try:
+                        job, failed, result = conn.recv()
+                    except EOFError:
+                        # the process died (e.g. killed by the OOM killer)
+                        job, failed, result = state['last'], True, (
+                            RuntimeError('worker process %s died' % worker), '')
+                    if failed and self.fail_fast:
+                        raise SphinxParallelError(*result)
+                    if failed:
+                        errors.append((job, SphinxParallelError(*result)))
+                        self._stop(conn, failed=True)
+                        if pending:
+                            self._send(self._start(worker), pending.pop(0))
+                        continue
+                    result, state['rss'] = result
+                    if state['jobs'] == 1:
+                        self.rss[job] = state['rss']
+                    result_func(job, worker, result)
+                    if pending:
+                        self._send(conn, pending.pop(0))
+                    else:
+                        self._stop(conn)
+        finally:
+            for conn in list(self.workers):
+                self._stop(conn, terminate=True)
+        return errors
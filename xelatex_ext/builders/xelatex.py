@@ -20,28 +20,73 @@
 # imports
 # ==============================================================================
 
+import io
+import json
+import re
+import time
+from fnmatch import fnmatch
 from os import path, listdir
-from six import iteritems
+from six import iteritems, text_type
 
 from docutils import nodes
-from docutils.io import FileOutput
+from docutils.io import StringOutput
 from docutils.utils import new_document
 
 from sphinx import addnodes
 from sphinx.builders import Builder
 from sphinx.environment import NoUri
 from sphinx.errors import SphinxError
+from sphinx.util import docname_join
 from sphinx.util.console import bold, darkgreen
 from sphinx.util.nodes import inline_all_toctrees
-from sphinx.util.osutil import copyfile
-from sphinx.util.parallel import ParallelTasks, make_chunks
 
+from xelatex_ext import __version__
+from xelatex_ext.builders.artifacts import ArtifactCache, LocalDirCache
+from xelatex_ext.builders.assets import AssetStore
+from xelatex_ext.builders.buildlog import BuildLog, NORMAL, VERBOSE
+from xelatex_ext.builders.compiler import (
+    CompileJob, TeXCompiler, cpu_count, AUX_EXTENSIONS)
+from xelatex_ext.builders.fingerprint import data_digest, file_digest
+from xelatex_ext.builders.fragcache import FragmentCache
+from xelatex_ext.builders.imageconv import (
+    ImageConverter, CONVERTED_IMAGE_TYPES, conversion, missing_converter)
+from xelatex_ext.builders.imageinfo import ImageInfo
+from xelatex_ext.builders.journal import BuildJournal
+from xelatex_ext.builders.labels import LabelIndex
+from xelatex_ext.builders.memory import MemoryProbe
+from xelatex_ext.builders.outfile import (
+    write_if_changed, write_text_if_changed, copy_if_changed)
+from xelatex_ext.builders.report import BuildReport, BUILD
+from xelatex_ext.builders.schedule import TargetTimings, lpt_schedule
+from xelatex_ext.builders.workers import WorkerPool
 from xelatex_ext.writers.doccfg import XeLaTeXDocSet
-from xelatex_ext.writers.xelatex import XeLaTeXWriter
+from xelatex_ext.writers.xelatex import (
+    XeLaTeXWriter, fragment_boundaries, fragment_include)
 
 XETEX_INPUTS_FOLDER = path.abspath(
     path.join(path.dirname(__file__), "xetex_inputs"))
 
+SHARED_PREAMBLE = "xelatex-preamble.tex"
+
+IMAGE_MANIFEST = "xelatex-images.json"
+
+LABEL_INDEX = "xelatex-labels.json"
+
+JOURNAL = "xelatex-journal.json"
+
+RUNTIME_CONFIG = (
+    'xelatex_targets', 'xelatex_artifact_', 'xelatex_fragment_cache'
+    , 'xelatex_worker_', 'xelatex_memory_', 'xelatex_log_level'
+    , 'xelatex_fail_fast', 'xelatex_resume', 'xelatex_build_report'
+    , 'xelatex_compile', 'xelatex_tex_command', 'xelatex_index_command'
+    , 'xelatex_format_command')
+u"""Config values which do not change the TeX output (not in the fingerprint
+of a target)."""
+
+EXTERNAL_URI = "xr:"
+u"""Prefix of the URIs referring to other targets (see
+:py:meth:`XeLaTeXBuilder.get_target_uri`)."""
+
 # ==============================================================================
 class XeLaTeXBuilder(Builder):
 # ==============================================================================
@@ -68,9 +113,113 @@ class XeLaTeXBuilder(Builder):
         Init / set required members.
 
         :ivar XeLateXDocSet docset:  Extended (Xe)LaTeX *per-document* settings.
+
+        :ivar set docnames: Names of the documents in the target in process.
+
+        :ivar set updated_docnames: Names of the documents, which have been
+            (re-) read in this build (see :py:meth:`write_fragments`).
+
+        :ivar bool affected_only: If true, only the targets with updated
+            documents are written (see :py:mod:`xelatex_ext.watch`).
+
+        :ivar BuildReport report: *Per-target* records of the build, dumped to
+            ``xelatex_build_report`` in the output folder.
+
+        :ivar MemoryProbe memprobe: Memory accounting of the target in process
+            (see ``xelatex_memory_profile``).
+
+        :ivar FragmentCache fragment_cache: Cache of the translated fragments
+            or ``None`` (see ``xelatex_fragment_cache``).
+
+        :ivar ArtifactCache artifact_cache: Cache of the build artifacts or
+            ``None`` (see ``xelatex_artifact_cache``).
+
+        :ivar ImageInfo imageinfo: Metadata (natural size) of the images, read
+            from the file headers.
+
+        :ivar LabelIndex label_index: Targets of the documents and labels, built
+            once per build (see :py:meth:`get_target_uri`).
+
+        :ivar AssetStore asset_store: Store of the images or ``None`` (see
+            ``xelatex_asset_store``).
+
+        :ivar ImageConverter imageconv: Cache of the converted images, if the
+            asset store is used, the converted images are stored in it.
+
+        :ivar dict conversions: The ``(uri, operation)`` of each converted image
+            (see :py:meth:`post_process_images`).
+
+        :ivar TargetTimings timings: Durations of the targets in the previous
+            builds, the parallel processes are scheduled by them (see
+            :py:meth:`_write_parallel`).
+
+        :ivar BuildJournal journal: The targets written by the builds with
+            ``xelatex_resume``.
+
+        :ivar dict fingerprints: The fingerprints of the targets computed in
+            this process (see :py:meth:`fingerprint`).
+
+        :ivar dict completed: The fingerprint and images of each target written
+            by this process and not yet recorded (see
+            :py:meth:`record_completed`).
+
+        :ivar set written: Names of the targets written (or resumed) in this
+            build, they are compiled by :py:meth:`compile_targets`.
+
+        :ivar str failed: Summary of the targets which failed in this build
+            (without ``xelatex_fail_fast``) or ``None``, raised by
+            :py:meth:`finish` when the other targets are complete.
+
+        :ivar BuildLog log: Level-gated messages of the build (see
+            ``xelatex_log_level``), buffered in the parallel processes.
         """
         super(XeLaTeXBuilder, self).init()
-        self.docset = XeLaTeXDocSet(self.app)
+        self.docnames = set()
+        self.updated_docnames = set()
+        self.affected_only    = False
+        self.docset   = XeLaTeXDocSet(self.app)
+        level = self.config.xelatex_log_level
+        if level is None:
+            level = NORMAL + self.app.verbosity
+        self.log      = BuildLog(self.info, int(level))
+        self.report   = BuildReport()
+        self.memprobe = MemoryProbe(
+            enabled = self.config.xelatex_memory_profile
+            , top   = self.config.xelatex_memory_top)
+        self.fragment_cache = None
+        if self.config.xelatex_fragment_cache:
+            self.fragment_cache = FragmentCache(
+                path.join(self.doctreedir, 'xelatex-fragments'))
+        self.artifact_cache = self.config.xelatex_artifact_cache or None
+        if (self.artifact_cache is not None
+            and not isinstance(self.artifact_cache, ArtifactCache)):
+            self.artifact_cache = LocalDirCache(
+                path.join(self.confdir, self.artifact_cache)
+                , max_size = self.config.xelatex_artifact_cache_size)
+        self.imageinfo = ImageInfo(
+            path.join(self.doctreedir, 'xelatex-imageinfo.pickle'))
+        self.label_index = LabelIndex()
+        self.timings = TargetTimings(
+            path.join(self.doctreedir, 'xelatex-timings.json'))
+        self.journal = BuildJournal(path.join(self.outdir, JOURNAL))
+        self.fingerprints = dict()
+        self.completed    = dict()
+        self.written      = set()
+        self.failed       = None
+        self.asset_store = None
+        if self.config.xelatex_asset_store:
+            self.asset_store = AssetStore(
+                path.join(self.confdir, self.config.xelatex_asset_store)
+                , link = self.config.xelatex_asset_link)
+        self.imageconv = ImageConverter(
+            self.asset_store and self.asset_store.folder
+            or path.join(self.doctreedir, 'xelatex-images')
+            , jobs = cpu_count())
+        self.conversions = dict()
+        self.unconverted = set()
+        self.supported_image_types = (
+            self.supported_image_types + CONVERTED_IMAGE_TYPES)
+        self._xetex_inputs = None
 
     def get_outdated_docs(self):
         u"""Allways returns *all documents*
@@ -89,70 +238,273 @@ class XeLaTeXBuilder(Builder):
 
     def prepare_writing(self, docCfgList):
         """A place where you can add logic before :meth:`write_doc` is run"""
-        pass
+        if self.config.xelatex_shared_preamble:
+            self.write_shared_preamble()
+
+    def write_shared_preamble(self):
+        u"""Write the static part of the preamble to the shared preamble file
+        (see ``xelatex_shared_preamble``)."""
+        styles = [fname[:-4] for fname in sorted(listdir(XETEX_INPUTS_FOLDER))
+                  if fname.endswith('.sty')]
+        translator = self.writerClass(self).translator_class
+        write_text_if_changed(
+            path.join(self.outdir, SHARED_PREAMBLE)
+            , translator.shared_preamble(styles))
 
-    def write(self, *_ignored):
-        if not self.docset.docs:
+    def dump_preamble_format(self):
+        u"""Dump the shared preamble into a format (see
+        ``xelatex_preamble_format``).
+
+        The format is only dumped if the shared preamble has been changed since
+        the last dump."""
+        job = CompileJob(
+            SHARED_PREAMBLE, self.config.xelatex_format_command, self.outdir
+            , product = '.fmt')
+        self.info(bold('dumping preamble format %s.fmt... ' % job.jobname)
+                  , nonl=True)
+        result = job.run(self._compile_line)
+        self.report.add(SHARED_PREAMBLE, 'compile', result)
+        self.info(result['status'])
+        if result['status'] == 'failed':
+            self.warn('%s: dump of the preamble format failed with exit code %s'
+                      % (SHARED_PREAMBLE, result['returncode']))
+
+    def write(self, _build_docnames, updated_docnames, _method='update'):
+        self.updated_docnames = set(updated_docnames)
+        self.report.clear()
+        # finish() copies only the images of the targets written in this build
+        self.images = dict()
+        self.conversions = dict()
+        self.written = set()
+        self.failed = None
+        self.label_index.build(
+            self.docset, self.target_docnames
+            , self.env.domaindata['std']['labels'], self.jobname)
+        docs = self.docset.selected
+        if self.affected_only:
+            docs = self.affected_targets()
+        if not docs:
             self.info(bold('no XeLaTeX targets to build'))
             return
 
         self.info(bold('preparing targets... '), nonl=True)
-        self.prepare_writing(self.docset.docs)
+        # read the image headers once, before the parallel processes are
+        # forked
+        self.imageinfo.update([
+            path.join(self.srcdir, fname) for fname in sorted(self.env.images)])
+        self.prepare_writing(docs)
         self.info('done')
+        pending = docs
+        if self.config.xelatex_resume:
+            pending = self.resume_targets(docs)
+        else:
+            self.journal.clear()
 
         warnings = []
+        errors   = []
         self.env.set_warnfunc(
             lambda *args, **kwargs: warnings.append((args, kwargs)))
-        if self.parallel_ok:
-            # number of subprocesses is parallel-1 because the main process
-            # is busy loading doctrees and doing write_doc_serialized()
-            self._write_parallel(
-                self.docset.docs, warnings, nproc=self.app.parallel - 1)
-        else:
-            self._write_serial(self.docset.docs, warnings)
-        self.env.set_warnfunc(self.warn)
+        try:
+            if self.parallel_ok and len(pending) > 1:
+                # number of subprocesses is parallel-1 because the main
+                # process is busy loading doctrees and doing
+                # write_doc_serialized()
+                self._write_parallel(
+                    pending, warnings, errors, nproc=self.app.parallel - 1)
+            elif pending:
+                self._write_serial(pending, warnings, errors)
+        finally:
+            self.env.set_warnfunc(self.warn)
+        if errors:
+            # the other targets are completed by finish(), which raises then
+            for targetname, exc in errors:
+                self.warn('%s: %s' % (targetname, exc))
+            self.failed = (
+                '%d of %d targets failed (%s), %s' % (
+                    len(errors), len(docs)
+                    , ', '.join([targetname for targetname, _ in errors])
+                    , self.config.xelatex_resume
+                    and 'rerun the build to resume it'
+                    or 'build with -D xelatex_resume=1 to resume failed builds'))
+        for docCfg in docs:
+            duration = self.report.get(docCfg.targetname, 'duration')
+            if duration is not None:
+                self.timings.record(
+                    docCfg.targetname, duration
+                    , len(self.target_docnames(docCfg))
+                    , self.report.get(docCfg.targetname, 'worker_rss'))
+
+    def affected_targets(self):
+        u"""Return the targets which include an updated document (or which has
+        not yet been written)."""
+        return [
+            docCfg for docCfg in self.docset.selected
+            if (not path.exists(path.join(self.outdir, docCfg.targetname))
+                or self.updated_docnames.intersection(
+                    self.target_docnames(docCfg)))]
+
+    def resume_targets(self, docCfgList):
+        u"""Return the targets which are not in the journal (see
+        ``xelatex_resume``).
+
+        The targets which have been written with the same fingerprint (and
+        whose output exists) are skipped, their images are copied by
+        :py:meth:`finish`."""
+        retVal = []
+        for docCfg in docCfgList:
+            entry = self.journal.get(docCfg.targetname, self.fingerprint(docCfg))
+            if (entry is None
+                or not path.exists(path.join(self.outdir, docCfg.targetname))):
+                retVal.append(docCfg)
+                continue
+            self.written.add(docCfg.targetname)
+            self.images.update(entry['images'])
+            self.conversions.update(entry['conversions'])
+            self.report.add(docCfg.targetname, 'journal', 'resumed')
+            self.log('%s: resumed' % docCfg.targetname)
+        return retVal
 
-    def _write_serial(self, docCfgList, warnings):
+    def record_completed(self):
+        u"""Record the targets written by this process as written and (with
+        ``xelatex_resume``) in the journal."""
+        for targetname, entry in iteritems(self.completed):
+            self.written.add(targetname)
+            if self.config.xelatex_resume:
+                self.journal.record(
+                    targetname, entry['fingerprint']
+                    , entry['images'], entry['conversions'])
+        self.completed = dict()
+
+    def fingerprint(self, docCfg):
+        u"""Return the fingerprint of target *docCfg* (see
+        :py:meth:`target_fingerprint`), if it is needed by ``xelatex_resume``
+        or the ``xelatex_artifact_cache``, otherwise ``None``.
+
+        The fingerprint is computed once, by the process which needs it (the
+        parallel processes compute the fingerprints of their targets)."""
+        if not (self.config.xelatex_resume or self.artifact_cache is not None):
+            return None
+        fingerprint = self.fingerprints.get(docCfg.targetname)
+        if fingerprint is None:
+            fingerprint = self.target_fingerprint(docCfg)
+            self.fingerprints[docCfg.targetname] = fingerprint
+        return fingerprint
+
+    def _write_target(self, docCfg, errors):
+        u"""Write target *docCfg* in this process.  Without
+        ``xelatex_fail_fast``, the exception of a failed target is added to
+        *errors*."""
+        self.write_doc_serialized(docCfg)
+        try:
+            self.write_doc(docCfg)
+        except Exception as exc:  # pylint: disable=W0703
+            if self.config.xelatex_fail_fast:
+                raise
+            errors.append((docCfg.targetname, exc))
+        self.record_completed()
+
+    def _write_serial(self, docCfgList, warnings, errors):
         for docCfg in self.app.status_iterator(
                 docCfgList, 'writing output... ', darkgreen, len(docCfgList)):
-            self.write_doc_serialized(docCfg)
-            self.write_doc(docCfg)
+            self._write_target(docCfg, errors)
         for warning, kwargs in warnings:
             self.warn(*warning, **kwargs)
 
-    def _write_parallel(self, docCfgList, warnings, nproc):
-        def write_process(docs):
+    def _write_parallel(self, docCfgList, warnings, errors, nproc):
+        u"""Write the targets by a pool of forked processes (see
+        :py:class:`WorkerPool`).
+
+        The processes are forked after the warm-up target has been written in
+        this process, they share the environment, the label index, the image
+        metadata and the compiled templates copy-on-write.  A process gets the
+        names of its targets and returns only the warnings, report sections,
+        images and messages of them.  The longest targets are dispatched first
+        (see :py:attr:`timings`).
+
+        A process is recycled after ``xelatex_worker_max_targets`` targets or
+        if its memory (its USS, see :py:class:`WorkerPool`) exceeds
+        ``xelatex_worker_max_rss`` (bytes).  The targets which exceeded the
+        limit in a previous build are pinned to a fresh process.  With
+        ``xelatex_fail_fast``, the outstanding targets are canceled, if a
+        target raises."""
+
+        targets = dict([(docCfg.targetname, docCfg) for docCfg in docCfgList])
+
+        def write_process(targetname):
             local_warnings = []
             def warnfunc(*args, **kwargs):
                 local_warnings.append((args, kwargs))
             self.env.set_warnfunc(warnfunc)
-            for targetname, doctree in docs:
-                self.write_doc(targetname, doctree)
-            return local_warnings
+            self.report.clear()
+            # no nested parallel processes (see write_fragments)
+            self.parallel_ok = False
+            self.images = dict()
+            self.conversions = dict()
+            self.completed = dict()
+            # the messages of a process are printed by the main process
+            self.log.buffer()
+            self.write_doc(targets[targetname])
+            return (local_warnings, self.report.targets, self.images
+                    , self.conversions, self.log.release(), self.completed)
 
-        def add_warnings(_docs, wlist):
+        def add_warnings(targetname, worker, result):
+            wlist, report, images, conversions, log, completed = result
+            self.log.replay(log)
+            self.completed.update(completed)
+            self.record_completed()
             warnings.extend(wlist)
+            self.report.update(report)
+            # the images referenced by the targets of the subprocess
+            self.images.update(images)
+            self.conversions.update(conversions)
+            queues[worker].append(targetname)
 
-        # warm up caches/compile templates using the first document
-        docCfg, docCfgList = docCfgList[0], docCfgList[1:]
+        costs = dict([
+            (docCfg.targetname, self.timings.estimate(
+                docCfg.targetname, len(self.target_docnames(docCfg))))
+            for docCfg in docCfgList])
 
-        self.write_doc_serialized(docCfg)
-        self.write_doc(docCfg)
+        # warm up caches/compile templates using the cheapest target
+        docCfgList = sorted(docCfgList, key=lambda d: costs[d.targetname])
+        docCfg, docCfgList = docCfgList[0], docCfgList[1:]
 
-        tasks  = ParallelTasks(nproc)
-        chunks = make_chunks(docCfg, nproc)
+        self._write_target(docCfg, errors)
 
-        for chunk in self.app.status_iterator(
-                chunks, 'writing output... ', darkgreen, len(chunks)):
-            arg = []
-            for docCfg in chunk:
-                self.write_doc_serialized(docCfg)
-                arg.append((docCfg,))
-            tasks.add_task(write_process, arg, add_warnings)
+        for docCfg in docCfgList:
+            self.write_doc_serialized(docCfg)
+        # the predicted makespan of the longest-processing-time-first schedule,
+        # the pool dispatches the targets in this order to the next idle
+        # process, the actual queues are recorded by add_warnings
+        _, loads = lpt_schedule(
+            dict([(d.targetname, costs[d.targetname]) for d in docCfgList])
+            , nproc)
+        queues = [[] for _ in range(nproc)]
 
-        # make sure all threads have finished
-        self.info(bold('waiting for workers...'))
-        tasks.join()
+        self.info(bold('writing %d targets (%d processes)...'
+                       % (len(docCfgList), min(nproc, len(docCfgList)))))
+        max_rss = self.config.xelatex_worker_max_rss
+        pool    = WorkerPool(
+            nproc, write_process
+            , max_jobs = self.config.xelatex_worker_max_targets
+            , max_rss  = max_rss
+            , fresh    = [
+                d.targetname for d in docCfgList
+                if max_rss and (self.timings.rss(d.targetname) or 0) > max_rss]
+            , fail_fast = self.config.xelatex_fail_fast)
+        start = time.time()
+        errors.extend(pool.run(
+            [d.targetname for d in reversed(docCfgList)], add_warnings))
+        for targetname, value in iteritems(pool.rss):
+            self.report.add(targetname, 'worker_rss', value)
+        self.report.add(BUILD, 'schedule', dict(
+            processes   = nproc
+            , queues    = [queue for queue in queues if queue]
+            , pinned    = sorted(pool.fresh)
+            , recycled  = pool.recycled
+            , estimates = dict([
+                (name, round(cost, 3)) for name, cost in iteritems(costs)])
+            , predicted = round(max(loads or [0.0]), 3)
+            , actual    = round(time.time() - start, 3)))
 
         for warning, kwargs in warnings:
             self.warn(*warning, **kwargs)
@@ -166,27 +518,358 @@ class XeLaTeXBuilder(Builder):
     def write_doc(self, docCfg):  # pylint: disable=W0221
         """Where you actually write something to the filesystem.
         """
-        self.info("processing " + docCfg.targetname + "... ", nonl=1)
+        self.log("processing " + docCfg.targetname + "... ", nonl=1)
+        start = time.time()
+
+        fingerprint = self.fingerprint(docCfg)
+        if self.artifact_cache is not None:
+            meta = self.artifact_cache.get(fingerprint, self.outdir)
+            self.report.add(docCfg.targetname, 'artifact_cache', dict(
+                fingerprint = fingerprint, hit = meta is not None))
+            if meta is not None:
+                self.images.update(meta['images'])
+                self.conversions.update(meta.get('conversions', {}))
+                self.completed[docCfg.targetname] = dict(
+                    fingerprint = fingerprint, images = meta['images']
+                    , conversions = meta.get('conversions', {}))
+                self.log("cached")
+                return
 
         # The argument doctree are covered by the self.assemble_doctree
         # method. The docCfg is shipped in the writer.document.docCfg
 
-        doctree = self.assemble_doctree(docCfg)
-        doctree.docCfg = docCfg
+        self.memprobe.start()
+        try:
+            if self.fragment_cache is not None:
+                cache_stats = self.fragment_cache.stats()
+            doctree = self.assemble_doctree(docCfg)
+            doctree.docCfg = docCfg
+
+            known_images = set(self.images)
+            self.post_process_images(doctree)
+            self.log("writing... ", nonl=1, level=VERBOSE)
+
+            # the targets referred by this target (see the translator astext)
+            doctree.external_docs = self.external_docs(doctree)
+
+            if docCfg.split_fragments or docCfg.include_only:
+                doctree.fragments = self.write_fragments(docCfg, doctree)
 
-        self.post_process_images(doctree)
-        self.info("writing... ", nonl=1)
-        outFile = FileOutput(
-            destination_path = path.join(self.outdir, docCfg.targetname)
-            , encoding       = 'utf-8')
+            writer = self.writerClass(self)
+            if self.stream_assembly(docCfg):
+                # the output of the released subtrees is streamed to the file
+                writer.write_stream(
+                    doctree, path.join(self.outdir, docCfg.targetname))
+                self.memprobe.record('translated')
+            else:
+                output = writer.write(doctree, StringOutput(encoding='utf-8'))
+                self.memprobe.record('translated')
+                write_if_changed(
+                    path.join(self.outdir, docCfg.targetname), output)
+            self.memprobe.record('written')
+
+            if docCfg.draft:
+                # draft placeholders, the images are not copied by finish()
+                for uri in set(self.images) - known_images:
+                    del self.images[uri]
+                images, conversions = dict(), dict()
+            else:
+                images, conversions = self.target_images(doctree)
+            self.completed[docCfg.targetname] = dict(
+                fingerprint = fingerprint, images = images
+                , conversions = conversions)
+            if self.artifact_cache is not None:
+                self.store_artifacts(
+                    docCfg, doctree, fingerprint, images, conversions)
+        finally:
+            # stop tracing, even if the target fails (see xelatex_fail_fast)
+            phases = self.memprobe.stop()
+
+        if self.memprobe.enabled:
+            self.report.add(docCfg.targetname, 'memory', phases)
+        if self.fragment_cache is not None:
+            self.report.add(docCfg.targetname, 'fragment_cache', dict([
+                (name, val - cache_stats[name])
+                for name, val in self.fragment_cache.stats().items()]))
+        self.report.add(
+            docCfg.targetname, 'duration', round(time.time() - start, 3))
+        self.log("done")
+
+    def write_fragments(self, docCfg, doctree):
+        u"""Write the top-level ``start_of_file`` subtrees into fragment files.
+
+        Each subtree of *doctree* is replaced by a ``\\include`` of its fragment
+        file.  The fragments are translated by forked processes (see
+        :py:class:`WorkerPool`, if parallel build is active), the counters at the boundaries are fixed by a pre-pass (see
+        :py:func:`fragment_boundaries`).  Returns a list with the requirements
+        of the fragments (see :py:meth:`XeLaTeXTranslator.fragment_result`).
+
+        A fragment is only translated, if one of its documents has been updated
+        or its state or the target's settings has been changed since the last
+        build (see ``<jobname>.fragments.json``).  With ``include_only``, the
+        fragments of the documents not selected are not translated (as long
+        as the fragment file exists) and ``doctree.includeonly`` is set to the
+        names of the selected fragments.
+        """
+        manifest  = self.read_fragment_manifest(docCfg)
+        settings  = docCfg.settings()
+        settings.pop('include_only', None)  # the selection is not translated
+        settings  = data_digest(settings)
+        fragments = []
+        reused    = []
+        selected  = []
+        for node, state in fragment_boundaries(doctree):
+            docname  = node['docname']
+            docnames = [n['docname'] for n in node.traverse(addnodes.start_of_file)]
+            fname    = self.fragment_name(docCfg, docname)
+            entry    = manifest.get(fname)
+            node.replace_self(
+                fragment_include(docname=docname, filename=fname))
+            include = (not docCfg.include_only
+                       or [p for p in docCfg.include_only if fnmatch(docname, p)])
+            if include:
+                selected.append(fname)
+            if (entry is not None
+                and path.exists(path.join(self.outdir, fname + '.tex'))
+                and (not include
+                     or (entry['state'] == state
+                         and entry['settings'] == settings
+                         and not self.updated_docnames.intersection(docnames)))):
+                reused.append(entry)
+            else:
+                fragments.append((fname, node, dict(
+                    state = state, settings = settings, docnames = docnames)))
+
+        if docCfg.include_only:
+            if not selected:
+                self.warn('%s: no document matches include_only %r'
+                          % (docCfg.targetname, docCfg.include_only))
+            doctree.includeonly = selected
+        if not fragments and not reused:
+            return []
 
         writer = self.writerClass(self)
-        writer.write(doctree , outFile)
-        self.info("done")
+        def translate(chunk):
+            results = []
+            for fname, node, entry in chunk:
+                result = writer.translate_fragment(doctree, node, entry['state'])
+                write_text_if_changed(
+                    path.join(self.outdir, fname + '.tex'), result.pop('output'))
+                result.update(entry, filename = fname)
+                results.append(result)
+            return results
+
+        self.log("%d fragments (%d unchanged)... "
+                 % (len(fragments) + len(reused), len(reused))
+                 , nonl=1, level=VERBOSE)
+        self.report.add(docCfg.targetname, 'fragments', dict(
+            translated = len(fragments), reused = len(reused)))
+        nproc = self.app.parallel - 1
+        if not self.parallel_ok or nproc < 2 or len(fragments) < 2:
+            results = translate(fragments)
+        else:
+            # one job per fragment, the fragments are translated by forked
+            # processes (they share the doctree copy-on-write)
+            jobs = dict([(fname, (fname, node, entry))
+                         for fname, node, entry in fragments])
+            done = dict()
+            def collect(fname, worker, result):
+                done[fname] = result
+            WorkerPool(nproc, lambda fname: translate([jobs[fname]])[0]).run(
+                [fname for fname, _, _ in fragments], collect)
+            results = [done[fname] for fname, _, _ in fragments]
+
+        results = reused + results
+        self.write_fragment_manifest(docCfg, results)
+        return results
+
+    def fragment_manifest(self, docCfg):
+        return path.join(self.outdir, self.jobname(docCfg) + '.fragments.json')
+
+    def read_fragment_manifest(self, docCfg):
+        u"""Return the fragments (by filename) of the last build of the
+        target."""
+        try:
+            with io.open(self.fragment_manifest(docCfg), encoding='utf-8') as f:
+                return dict([(entry['filename'], entry) for entry in json.load(f)])
+        except (IOError, OSError, ValueError, KeyError):
+            return dict()
+
+    def write_fragment_manifest(self, docCfg, fragments):
+        fragments = sorted(fragments, key=lambda entry: entry['filename'])
+        write_text_if_changed(
+            self.fragment_manifest(docCfg)
+            , text_type(json.dumps(fragments, indent=1, sort_keys=True)))
+
+    @staticmethod
+    def jobname(docCfg):
+        u"""Name of the target's TeX job (the targetname without ``.tex``)."""
+        jobname = docCfg.targetname
+        if jobname.endswith('.tex'):
+            jobname = jobname[:-4]
+        return jobname
+
+    def fragment_name(self, docCfg, docname):
+        u"""Name of the fragment file (without ``.tex``) of *docname*."""
+        return '%s-%s' % (
+            self.jobname(docCfg), re.sub(r'[^A-Za-z0-9_-]', '-', docname))
+
+    def target_docnames(self, docCfg):
+        u"""Return the docnames of the target, without assembling the target
+        (see :py:meth:`assemble_doctree`)."""
+        docnames = set()
+        pending  = [docCfg.docname] + list(docCfg.appendices)
+        while pending:
+            docname = pending.pop()
+            if docname not in docnames:
+                docnames.add(docname)
+                pending.extend(self.env.toctree_includes.get(docname, ()))
+        return docnames
+
+    def target_fingerprint(self, docCfg):
+        u"""Return the fingerprint of the target (the key in the
+        ``xelatex_artifact_cache``).
+
+        The fingerprint is a digest of the sources (with their dependencies,
+        e.g. included files) and images of the target's documents, the labels
+        and documents the target refers to (see :py:meth:`target_references`),
+        the *per-document* settings, the related config values, the content of
+        the ``xetex_inputs`` and the version of this extension."""
+        docnames = self.target_docnames(docCfg)
+        labels, refdocs = self.target_references(docnames)
+        secnumbers = getattr(self.env, 'toc_secnumbers', {})
+        fignumbers = getattr(self.env, 'toc_fignumbers', {})
+        if self._xetex_inputs is None:
+            self._xetex_inputs = dict([
+                (fname, file_digest(path.join(XETEX_INPUTS_FOLDER, fname)))
+                for fname in listdir(XETEX_INPUTS_FOLDER)])
+        config = dict([
+            (name, getattr(self.config, name)) for name in self.config.values
+            if (name.startswith(('latex_', 'xelatex_'))
+                and not name.startswith(RUNTIME_CONFIG))
+            or name in ('project', 'copyright', 'version', 'release', 'today'
+                        , 'today_fmt', 'language', 'highlight_language'
+                        , 'pygments_style', 'trim_doctest_flags')])
+        return data_digest(dict(
+            version        = __version__
+            , sources      = dict([
+                (docname, self.source_digests(docname))
+                for docname in docnames])
+            , images       = dict([
+                (fname, file_digest(path.join(self.srcdir, fname)))
+                for fname, (imgdocs, _) in iteritems(self.env.images)
+                if docnames.intersection(imgdocs)])
+            , labels       = labels
+            , refdocs      = dict([
+                (docname, dict(
+                    title        = (self.env.titles[docname].astext()
+                                    if docname in self.env.titles else None)
+                    , secnumbers = secnumbers.get(docname)
+                    , fignumbers = fignumbers.get(docname)
+                    , jobname    = self.label_index.jobname(docname)))
+                for docname in refdocs])
+            , settings     = docCfg.settings()
+            , config       = config
+            , xetex_inputs = self._xetex_inputs))
+
+    def target_references(self, docnames):
+        u"""Return the labels and the documents the documents *docnames* refer
+        to (the ``pending_xref`` nodes of the ``std`` domain).
+
+        The labels are returned by ``<reftype>:<target>`` with their entries in
+        the :py:class:`LabelIndex` and the ``std`` domain, the documents as a
+        sorted list of docnames."""
+        std     = self.env.domaindata['std']
+        labels  = dict()
+        refdocs = set()
+        for docname in docnames:
+            doctree = self.env.get_doctree(docname)
+            for node in doctree.traverse(addnodes.pending_xref):
+                if node.get('refdomain') != 'std':
+                    continue
+                reftype, target = node['reftype'], node['reftarget']
+                if reftype == 'doc':
+                    refdocs.add(docname_join(node.get('refdoc', docname), target))
+                    continue
+                label = std['labels'].get(target)
+                anon  = std['anonlabels'].get(target)
+                obj   = std['objects'].get((reftype, target))
+                labels['%s:%s' % (reftype, target)] = (
+                    self.label_index.lookup(target) or label, anon, obj)
+                refdocs.update([entry[0] for entry in (label, anon, obj) if entry])
+        return labels, sorted(refdocs)
+
+    def source_digests(self, docname):
+        u"""Return the digests of the source file of document *docname* and of
+        its dependencies, by their names relative to the source folder (the
+        digests do not depend on the location of the project)."""
+        fnames = [self.env.doc2path(docname)]
+        fnames.extend(sorted(self.env.dependencies.get(docname, ())))
+        return dict([
+            (path.relpath(path.join(self.srcdir, fname), self.srcdir)
+             , file_digest(path.join(self.srcdir, fname)))
+            for fname in fnames])
+
+    def store_artifacts(self, docCfg, doctree, fingerprint, images, conversions):
+        u"""Store the TeX files of the target in the ``xelatex_artifact_cache``
+        with the *images* and *conversions* of the target."""
+        fnames = [docCfg.targetname]
+        fragments = getattr(doctree, 'fragments', None)
+        if fragments:
+            fnames.extend([entry['filename'] + '.tex' for entry in fragments])
+            fnames.append(path.basename(self.fragment_manifest(docCfg)))
+        self.artifact_cache.put(
+            fingerprint, self.outdir, fnames
+            , dict(images = images, conversions = conversions))
+
+    def target_images(self, doctree):
+        u"""Return the images and the conversions of the target *doctree*
+        (see :py:meth:`post_process_images`), including the images of the
+        released subtrees (see :py:meth:`load_subtree`)."""
+        images, conversions = getattr(doctree, 'released_images', ({}, {}))
+        images, conversions = dict(images), dict(conversions)
+        images.update([
+            (node['uri'], self.images[node['uri']])
+            for node in doctree.traverse(nodes.image)
+            if node['uri'] in self.images])
+        conversions.update([
+            (node['xelatex_file'], self.conversions[node['xelatex_file']])
+            for node in doctree.traverse(nodes.image)
+            if 'xelatex_file' in node])
+        return images, conversions
+
+    @staticmethod
+    def external_docs(tree):
+        u"""Return the jobnames of the targets referred in *tree* (see
+        :py:meth:`get_target_uri`)."""
+        return set([
+            node['refuri'][len(EXTERNAL_URI):].split('%', 1)[0]
+            for node in tree.traverse(nodes.reference)
+            if node.get('refuri', '').startswith(EXTERNAL_URI)])
+
+    def inline_toctrees(self, docname, tree, traversed):
+        u"""Inline all toctrees of document *docname* (see
+        :py:func:`sphinx.util.nodes.inline_all_toctrees`), the inlined documents
+        are added to :py:attr:`docnames` and *traversed*."""
+        # inline_all_toctrees() lists the included documents by self.info()
+        info, self.info = (
+            self.info, lambda msg='', nonl=False: self.log(msg, nonl, VERBOSE))
+        try:
+            return inline_all_toctrees(
+                self, self.docnames, docname, tree, darkgreen, traversed)
+        finally:
+            self.info = info
+
+    @staticmethod
+    def stream_assembly(docCfg):
+        u"""True if the documents of target *docCfg* are pulled in and
+        released by the writer (see ``stream_assembly``)."""
+        return bool(docCfg.stream_assembly
+                    and not (docCfg.split_fragments or docCfg.include_only))
 
     def assemble_doctree(self, docCfg):
 
-        self.info(darkgreen(docCfg.docname))
+        self.log(darkgreen(docCfg.docname) + ' ', nonl=1, level=VERBOSE)
         tree = self.env.get_doctree(docCfg.docname)
 
         if docCfg.toctree_only:
@@ -201,9 +884,21 @@ class XeLaTeXBuilder(Builder):
                 new_sect += node
             tree = new_tree
 
-        tree = inline_all_toctrees(
-            self, self.docset.docnames, docCfg.docname, tree
-            , darkgreen, [docCfg.docname])
+        # docnames of the target (see get_target_uri)
+        self.docnames = set([docCfg.docname] + list(docCfg.appendices))
+        self._traversed = [docCfg.docname]
+        if self.stream_assembly(docCfg):
+            # the documents are pulled in by the writer (see load_subtree), the
+            # references are resolved by the labels of the environment, not by
+            # the inlined tree
+            self.docnames.update(self.target_docnames(docCfg))
+            for toctreenode in tree.traverse(addnodes.toctree):
+                toctreenode.parent.replace(toctreenode, [
+                    addnodes.start_of_file(
+                        docname=text_type(includefile), xelatex_lazy=True)
+                    for includefile in toctreenode['includefiles']])
+        else:
+            tree = self.inline_toctrees(docCfg.docname, tree, self._traversed)
 
         tree['docname'] = docCfg.docname
 
@@ -211,19 +906,176 @@ class XeLaTeXBuilder(Builder):
             appendix = self.env.get_doctree(appendix_docname)
             appendix['docname'] = appendix_docname
             tree.append(appendix)
+        self.memprobe.record('assembled')
 
-        self.info("resolving references...")
+        self.log("resolving references... ", nonl=1, level=VERBOSE)
         self.env.resolve_references(tree, docCfg.docname, self)
         docCfg.replacePendingRefsInTree(tree)
         docCfg.initFromTree(tree)
+        self.memprobe.record('resolved')
         return tree
 
+    def load_subtree(self, doctree, node):
+        u"""Pull the document of the lazy ``start_of_file`` *node* into the
+        target *doctree* (see ``stream_assembly``).
+
+        The toctrees of the document are inlined, its references are resolved
+        and its images are post-processed.  Returns ``False`` if the document
+        has already been included by an other toctree of the target (the node
+        is dropped, as by :py:func:`inline_all_toctrees`).  The images of the
+        subtree are recorded in ``doctree.released_images`` (not in draft
+        mode), the subtree is released by the writer when it has been
+        translated."""
+        docCfg  = doctree.docCfg
+        docname = node['docname']
+        del node['xelatex_lazy']
+        if docname in self._traversed:
+            return False
+        self._traversed.append(docname)
+        self.log(darkgreen(docname) + ' ', nonl=1, level=VERBOSE)
+        try:
+            subtree = self.inline_toctrees(
+                docname, self.env.get_doctree(docname), self._traversed)
+        except Exception:  # pylint: disable=W0703
+            self.warn('toctree contains ref to nonexisting file %r' % docname
+                      , self.env.doc2path(docCfg.docname))
+            return False
+        node.extend(subtree.children)
+        for sectionnode in node.traverse(nodes.section):
+            if 'docname' not in sectionnode:
+                sectionnode['docname'] = docname
+
+        self.env.resolve_references(node, docCfg.docname, self)
+        docCfg.replacePendingRefsInTree(node)
+        self.post_process_images(node, docCfg)
+        doctree.external_docs.update(self.external_docs(node))
+        if docCfg.draft:
+            # draft placeholders, the images are not copied
+            return True
+        images, conversions = self.target_images(node)
+        released = getattr(doctree, 'released_images', None)
+        if released is None:
+            released = doctree.released_images = (dict(), dict())
+        released[0].update(images)
+        released[1].update(conversions)
+        return True
+
+    def post_process_images(self, doctree, docCfg=None):
+        u"""Pick the best candidate for all image URIs and the conversion of the
+        image (see :py:mod:`xelatex_ext.builders.imageconv`).
+
+        The name of a converted image is set in the ``xelatex_file`` attribute
+        of the image node, the converted images are added to
+        :py:attr:`conversions` (and not to ``images``).  If the asset store is
+        used, the images are named by the names in the store.  *doctree* may be
+        a subtree of the target *docCfg* (see :py:meth:`load_subtree`)."""
+        known = set(self.images)
+        super(XeLaTeXBuilder, self).post_process_images(doctree)
+        docCfg = docCfg or doctree.docCfg
+        if docCfg.draft:
+            return
+        if self.asset_store is not None:
+            # the names are (re-) set by the post processing of each target
+            for node in doctree.traverse(nodes.image):
+                if node['uri'] in self.images:
+                    self.images[node['uri']] = self.asset_store.name(
+                        path.join(self.srcdir, node['uri']))
+        plain = set()
+        for node in doctree.traverse(nodes.image):
+            uri = node['uri']
+            if uri not in self.images:
+                continue
+            fname = path.join(self.srcdir, uri)
+            operation = conversion(
+                fname, self.imageinfo.get(fname), docCfg.image_dpi
+                , self.config.xelatex_image_max_width)
+            if operation is None:
+                missing = missing_converter(fname)
+                if missing and uri not in self.unconverted:
+                    self.unconverted.add(uri)
+                    self.warn('image %s is not converted, %s is not installed'
+                              % (path.normpath(uri), missing))
+                plain.add(uri)
+                continue
+            if self.asset_store is not None:
+                node['xelatex_file'] = path.basename(
+                    self.imageconv.cached(fname, operation))
+            else:
+                node['xelatex_file'] = '%s-%s.%s' % (
+                    path.splitext(self.images[uri])[0]
+                    , data_digest(operation)[:8], operation['format'])
+            self.conversions[node['xelatex_file']] = (uri, operation)
+        for uri in set(self.images) - known - plain:
+            del self.images[uri]
+
+    def convert_images(self):
+        u"""Convert the images in :py:attr:`conversions` (if not cached) and
+        copy them to the output folder."""
+        converted, errors = self.imageconv.run(dict([
+            (name, (path.join(self.srcdir, uri), operation))
+            for name, (uri, operation) in iteritems(self.conversions)]))
+        for error in errors:
+            self.warn('image conversion failed: %s' % error)
+        for name, fname in iteritems(converted):
+            if not path.exists(fname):
+                continue
+            if self.asset_store is not None:
+                self.asset_store.install(name, path.join(self.outdir, name))
+            else:
+                copy_if_changed(fname, path.join(self.outdir, name))
+
+    def image_bbox(self, uri):
+        u"""Return the bounding box ``[llx, lly, urx, ury]`` in *big points* of
+        the image *uri* (relative to the source folder) or ``None`` if unknown
+        (see :py:mod:`xelatex_ext.builders.imageinfo`)."""
+        info = self.imageinfo.get(path.join(self.srcdir, uri))
+        return info and info['bbox']
+
+    def image_fingerprint(self, uri, fname=None):
+        u"""Return the data of image *uri* (relative to the source folder) which
+        goes into the TeX output: the content digest of the image, its bounding
+        box and the name of the copied (or converted, see *fname*) image file
+        with its conversion."""
+        if fname is None:
+            fname = self.images.get(uri, uri)
+        src = path.join(self.srcdir, uri)
+        return dict(
+            uri          = uri
+            , digest     = self.imageinfo.digest(src)
+            , bbox       = self.image_bbox(uri)
+            , fname      = fname
+            , conversion = self.conversions.get(fname, (None, None))[1])
+
+    def write_image_manifest(self):
+        u"""Write the metadata of the copied images to ``IMAGE_MANIFEST`` in
+        the output folder."""
+        manifest = dict()
+        for src, dst in iteritems(self.images):
+            info = self.imageinfo.get(path.join(self.srcdir, src))
+            if info is not None:
+                manifest[dst] = dict(info, source = path.normpath(src))
+        for dst, (src, operation) in iteritems(self.conversions):
+            info = self.imageinfo.get(path.join(self.srcdir, src))
+            if info is not None:
+                manifest[dst] = dict(
+                    info, source = path.normpath(src)
+                    , size = operation.get('size', info['size'])
+                    , dpi  = operation.get('dpi', info['dpi']))
+        write_text_if_changed(
+            path.join(self.outdir, IMAGE_MANIFEST)
+            , text_type(json.dumps(manifest, indent=1, sort_keys=True)))
+
     def get_target_uri(self, docname, typ=None):
-        """Return the target URI for a document name."""
-        if docname not in self.docset.docnames:
-            raise NoUri
-        else:
+        """Return the target URI for a document name.
+
+        A document of another target is referred by ``xr:<jobname>%<docname>``
+        (see ``xelatex_external_refs``)."""
+        if docname in self.docnames:
             return '%' + docname
+        jobname = self.label_index.jobname(docname)
+        if jobname is None or not self.config.xelatex_external_refs:
+            raise NoUri
+        return '%s%s%%%s' % (EXTERNAL_URI, jobname, docname)
 
     def get_relative_uri(self, from_, to, typ=None):
         """Return a relative URI between two source filenames.
@@ -235,13 +1087,28 @@ class XeLaTeXBuilder(Builder):
     def finish(self):
         # copy image files
         if self.images:
-            self.info(bold('copying images...'), nonl=1)
+            self.info(bold('copying images... '), nonl=1)
             for src, dst in iteritems(self.images):
-                self.info(' ' + src, nonl=1)
+                self.log(' ' + src, nonl=1, level=VERBOSE)
                 src = path.join(self.srcdir, src)
                 dst = path.join(self.outdir, dst)
-                copyfile(src, dst)
-            self.info()
+                if self.asset_store is not None:
+                    copied = self.asset_store.install(
+                        self.asset_store.add(src), dst)
+                else:
+                    copied = copy_if_changed(src, dst)
+                self.log.count(copied and 'images copied' or 'images unchanged')
+            self.log('', level=VERBOSE)
+            self.info('%d copied, %d unchanged' % tuple(
+                self.log.pop_counters('images copied', 'images unchanged')))
+        if self.conversions:
+            self.info(bold('converting images... '), nonl=1)
+            self.convert_images()
+            self.info('done')
+        self.write_image_manifest()
+        self.imageinfo.save()
+        self.timings.save()
+        self.label_index.dump(path.join(self.outdir, LABEL_INDEX))
 
         # copy XeTeX support files from texinputs
         self.info(bold('copying XeTeX support files...'))
@@ -249,22 +1116,23 @@ class XeLaTeXBuilder(Builder):
             if not fname.startswith('.'):
                 src = path.join(XETEX_INPUTS_FOLDER, fname)
                 dst = path.join(self.outdir, fname)
-                copyfile(src, dst)
+                copy_if_changed(src, dst)
 
         # copy additional files
         if self.docset.additional_files:
-            self.info(bold('copying additional files...'), nonl=1)
+            self.info(bold('copying additional files... '), nonl=1)
             _copied = []
             for fname in self.docset.additional_files:
-                self.info(' ' + fname, nonl=1)
+                self.log(' ' + fname, nonl=1, level=VERBOSE)
                 src = path.join(self.confdir, fname)
                 dst = path.join(self.outdir, path.basename(fname))
                 if dst in _copied:
                     raise SphinxError(
                         "two *additional* files with same basename `%s`"
                         % path.basename(fname))
-                copyfile(src, dst)
-            self.info()
+                copy_if_changed(src, dst)
+            self.log('', level=VERBOSE)
+            self.info('%d files' % len(self.docset.additional_files))
 
         # copy logo
         if self.docset.logo:
@@ -274,7 +1142,119 @@ class XeLaTeXBuilder(Builder):
             if not path.isfile(src):
                 raise SphinxError('logo file %r does not exist' % src)
             elif not path.isfile(dst):
-                copyfile(src, dst)
+                copy_if_changed(src, dst)
+
+        # dump the format of the shared preamble
+        if (self.config.xelatex_shared_preamble
+            and self.config.xelatex_preamble_format):
+            self.dump_preamble_format()
+
+        # run the TeX engine
+        if self.config.xelatex_compile:
+            self.compile_targets()
+
+        # drop the least recently used artifacts
+        if self.artifact_cache is not None:
+            self.artifact_cache.evict()
+        if self.fragment_cache is not None:
+            self.fragment_cache.evict(self.config.xelatex_fragment_cache_size)
+
+        # dump build report
+        if self.report and self.config.xelatex_build_report:
+            self.info(bold('writing build report...'))
+            self.report.dump(
+                path.join(self.outdir, self.config.xelatex_build_report))
 
         # all done
         self.info('done')
+        if self.failed:
+            raise SphinxError(self.failed)
+
+    def compile_targets(self):
+        u"""Run the TeX engine on the targets written (or resumed) in this
+        build (see ``xelatex_compile``).
+
+        The status of each target is added to the build report."""
+
+        targets = [docCfg for docCfg in self.docset.selected
+                   if docCfg.targetname in self.written]
+        if not targets:
+            return
+        jobs = self.config.xelatex_compile_jobs or cpu_count()
+        compiler = TeXCompiler(jobs=jobs, linefunc=self._compile_line)
+        for docCfg in targets:
+            job = CompileJob(
+                docCfg.targetname, self.config.xelatex_tex_command, self.outdir
+                , max_passes    = self.config.xelatex_compile_max_passes
+                , index_command = self.config.xelatex_index_command)
+            fingerprint = self.pdf_fingerprint(docCfg)
+            if fingerprint is not None:
+                # a restored PDF (and stamp) makes the job up-to-date
+                self.artifact_cache.get(fingerprint, self.outdir)
+            compiler.add(job)
+
+        self.info(bold('compiling %d targets (%d jobs)...'
+                       % (len(targets), jobs)))
+        results = compiler.run()
+        for docCfg in targets:
+            result = results[docCfg.targetname]
+            diagnostics = result.pop('diagnostics', None)
+            self.report.add(docCfg.targetname, 'compile', result)
+            if diagnostics is not None:
+                self.report.add(docCfg.targetname, 'diagnostics', diagnostics)
+                self._warn_diagnostics(docCfg, diagnostics)
+            self.info('%s: %s (%ss)' % (
+                darkgreen(docCfg.targetname), result['status']
+                , result.get('duration', '-')))
+            if result['status'] == 'ok' and self.pdf_fingerprint(docCfg):
+                self.store_pdf_artifacts(docCfg)
+            if result['status'] == 'failed':
+                self.warn('%s: TeX run failed with exit code %s'
+                          % (docCfg.targetname, result['returncode']))
+            elif result['status'] == 'ok' and not result['stable']:
+                self.warn('%s: auxiliary files not stable after %s passes'
+                          % (docCfg.targetname, result['passes']))
+
+    def pdf_fingerprint(self, docCfg):
+        u"""Return the key of the target's PDF in the ``xelatex_artifact_cache``
+        or ``None`` (see ``xelatex_artifact_cache_pdf``)."""
+        if self.artifact_cache is None or not self.config.xelatex_artifact_cache_pdf:
+            return None
+        record = self.report.get(docCfg.targetname, 'artifact_cache')
+        if not record:
+            return None
+        return record['fingerprint'] + '-pdf'
+
+    def store_pdf_artifacts(self, docCfg):
+        u"""Store the PDF, the stamp and the auxiliary files of the target in
+        the ``xelatex_artifact_cache``."""
+        job    = CompileJob(docCfg.targetname, None, self.outdir)
+        fnames = [job.jobname + ext for ext in (
+            ['.pdf', '.xelatex-stamp', '.ind'] + AUX_EXTENSIONS)]
+        fnames.extend([fname for fname in job.read_stamp().get('inputs', ())
+                       if fname.endswith('.aux')])
+        fnames = [fname for fname in sorted(set(fnames))
+                  if path.isfile(path.join(self.outdir, fname))]
+        self.artifact_cache.put(self.pdf_fingerprint(docCfg), self.outdir, fnames)
+
+    def _warn_diagnostics(self, docCfg, diagnostics):
+        # the TeX line is not a line of the source document, only the document
+        # is used as location of the warning
+        for record in diagnostics['records']:
+            if record['kind'] != 'error':
+                continue
+            msg = '%s: TeX error: %s' % (docCfg.targetname, record['message'])
+            if record['texline']:
+                msg += ' (tex line %s)' % record['texline']
+            location = None
+            if record['docname'] in self.env.all_docs:
+                location = self.env.doc2path(record['docname'])
+            self.warn(msg, location)
+        counts = diagnostics['counts']
+        if counts['undefined_reference'] or counts['undefined_citation']:
+            self.warn('%s: %s undefined references, %s undefined citations'
+                      % (docCfg.targetname, counts['undefined_reference']
+                         , counts['undefined_citation']))
+
+    def _compile_line(self, job, line):
+        self.app.verbose('[%s] %s' % (job.jobname, line))
@@ -0,0 +1,181 @@
+# -*- coding: utf-8; mode: python -*-
+# pylint: disable=C0330
+
+u"""
+    xelatex_ext.watch
+    ~~~~~~~~~~~~~~~~~
+
+    Watch mode of the XeLaTeX builder.
+
+    :copyright:  Copyright (C) 2016 Markus Heiser
+    :license:    GPL V3.0, see LICENSE for details.
+
+    The :py:class:`Watcher` keeps the sphinx application (with its environment,
+    the XeLaTeX builder and the builder's caches) in memory.  It polls the
+    source tree and, on a change, updates the environment and rebuilds only the
+    targets which include an updated document.
+
+    .. code-block:: bash
+
+        $ sphinx-xelatex-watch -j 4 docs dist/xelatex
+
+    A change of the ``conf.py`` creates a new application.
+"""
+
+# ==============================================================================
+#  imports
+# ==============================================================================
+
+from __future__ import print_function
+
+import argparse
+import os
+import sys
+import time
+
+from os import path
+
+# ==============================================================================
+def snapshot(folder, exclude=()):
+# ==============================================================================
+
+    u"""Return a dictionary with the ``(mtime, size)`` of each file below
+    *folder*.  Hidden files and the folders in *exclude* are ignored."""
+
+    exclude = [path.abspath(f) for f in exclude]
+    retVal  = dict()
+    for root, dirs, files in os.walk(folder):
+        dirs[:] = [d for d in dirs if not d.startswith('.')
+                   and path.abspath(path.join(root, d)) not in exclude]
+        for fname in files:
+            if fname.startswith('.'):
+                continue
+            fname = path.join(root, fname)
+            try:
+                stat = os.stat(fname)
+            except OSError:  # removed in the meantime
+                continue
+            retVal[fname] = (stat.st_mtime, stat.st_size)
+    return retVal
+
+# ==============================================================================
+class Watcher(object):
+# ==============================================================================
+
+    u"""Rebuild the XeLaTeX targets on changes of the source tree.
+
+    :param str srcdir: Source folder of the sphinx project.
+    :param str outdir: Output folder.
+    :param str confdir: Folder of the ``conf.py`` (default: *srcdir*).
+    :param str doctreedir: Folder of the doctrees (default:
+        ``<outdir>/.doctrees``).
+    :param dict confoverrides: Config values set on the command line.
+    :param int parallel: Number of parallel processes.
+    :param float interval: Seconds between two polls of the source tree.
+    """
+
+    def __init__(self, srcdir, outdir, confdir=None, doctreedir=None
+                 , confoverrides=None, parallel=0, interval=1.0
+                 , status=sys.stdout, warning=sys.stderr):
+        self.srcdir        = path.abspath(srcdir)
+        self.outdir        = path.abspath(outdir)
+        self.confdir       = path.abspath(confdir or srcdir)
+        self.doctreedir    = path.abspath(
+            doctreedir or path.join(outdir, '.doctrees'))
+        self.confoverrides = confoverrides or dict()
+        self.parallel      = parallel
+        self.interval      = interval
+        self.status        = status
+        self.warning       = warning
+        self.app           = None
+        self.files         = dict()
+
+    @property
+    def conffile(self):
+        return path.join(self.confdir, 'conf.py')
+
+    def create_app(self):
+        from sphinx.application import Sphinx
+        self.app = Sphinx(
+            self.srcdir, self.confdir, self.outdir, self.doctreedir, 'xelatex'
+            , dict(self.confoverrides), self.status, self.warning
+            , parallel=self.parallel)
+        # rebuild only targets with updated documents
+        self.app.builder.affected_only = True
+
+    def poll(self):
+        u"""Return a list of the files changed since the last poll."""
+        files = snapshot(self.srcdir, exclude=(self.outdir, self.doctreedir))
+        try:
+            stat = os.stat(self.conffile)
+            files[self.conffile] = (stat.st_mtime, stat.st_size)
+        except OSError:
+            pass
+        changed = [fname for fname in set(files) | set(self.files)
+                   if files.get(fname) != self.files.get(fname)]
+        self.files = files
+        return changed
+
+    def build(self):
+        start = time.time()
+        try:
+            if self.app is None:
+                self.create_app()
+            self.app.build()
+        except Exception as exc:  # pylint: disable=W0703
+            # the application may be broken, create a new one on next change
+            self.app = None
+            print('build failed: %s' % exc, file=self.warning)
+        else:
+            print('build finished in %.2f sec.' % (time.time() - start)
+                  , file=self.status)
+
+    def run(self):
+        self.poll()
+        self.build()
+        print('watching %s (CTRL-C to stop)' % self.srcdir, file=self.status)
+        while True:
+            time.sleep(self.interval)
+            changed = self.poll()
+            if not changed:
+                continue
+            if self.conffile in changed:
+                self.app = None
+            self.build()
+
+# ==============================================================================
+def main(argv=None):
+# ==============================================================================
+
+    u"""Console entry point of the watch mode (``sphinx-xelatex-watch``)."""
+
+    parser = argparse.ArgumentParser(
+        description = 'Rebuild the XeLaTeX targets on changes of the sources.')
+    parser.add_argument('srcdir')
+    parser.add_argument('outdir')
+    parser.add_argument('-c', dest='confdir', default=None
+                        , help='folder of the conf.py (default: srcdir)')
+    parser.add_argument('-d', dest='doctreedir', default=None
+                        , help='folder of the doctrees (default: outdir/.doctrees)')
+    parser.add_argument('-D', dest='define', action='append', default=[]
+                        , metavar='setting=value'
+                        , help='override a setting in conf.py')
+    parser.add_argument('-j', dest='parallel', type=int, default=0
+                        , help='number of parallel processes')
+    parser.add_argument('-i', dest='interval', type=float, default=1.0
+                        , help='seconds between two polls (default: 1.0)')
+    args = parser.parse_args(argv)
+
+    confoverrides = dict()
+    for define in args.define:
+        key, _, val = define.partition('=')
+        confoverrides[key] = val
+
+    watcher = Watcher(
+        args.srcdir, args.outdir, confdir=args.confdir
+        , doctreedir=args.doctreedir, confoverrides=confoverrides
+        , parallel=args.parallel, interval=args.interval)
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        return 0
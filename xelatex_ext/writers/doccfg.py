@@ -32,6 +32,8 @@ u"""
 #  imports
 # ==============================================================================
 
+from fnmatch import fnmatch
+
 from docutils import nodes
 from sphinx import addnodes
 from sphinx.errors import ConfigError
@@ -73,6 +75,12 @@ class DocData(dict):
     def __setattr__(self, attr, val):
         self[attr] = val
 
+    def settings(self):
+        u"""Return a dictionary with the *per-document* settings (without the
+        reference to the *document-set*)."""
+        return dict([(key, val) for key, val in self.items()
+                     if not key.startswith('_')])
+
     def initFromTree(self, tree):
         self._set_contentsname(tree)
         self._set_tocdepth(tree)
@@ -276,6 +284,52 @@ class XeLaTeXDocSet(DocSet):
     To get more infomations consult `Options for LaTeX output
     <http://www.sphinx-doc.org/en/stable/config.html#options-for-latex-output>`_
 
+    Optional config-names with defaults from the *global* ``xelatex_*``
+    settings:
+
+    * split_fragments: If true, each top-level document of the target is
+      written into its own fragment file, which is ``\\include``-ed by the
+      target (``xelatex_split_fragments``).
+
+    * include_only: List of docname patterns (``fnmatch``), if not empty, the
+      target is split into fragments and only the fragments of the matching
+      documents are included (``\\includeonly``).  Cross references to the
+      other documents are resolved by the ``.aux`` files of the previous TeX
+      runs (``xelatex_include_only``).
+
+    * draft: If true, the target is built for a fast preview; literal blocks
+      are not highlighted, images are replaced by placeholders of the same
+      size (the image files are not copied) and no domain indices are
+      generated (``xelatex_draft``).
+
+    * image_dpi: If set, raster images with a higher resolution are downsampled
+      to this resolution, the size of the image in the output is its natural
+      size, but not more than ``xelatex_image_max_width`` inches (requires
+      Pillow, see :py:mod:`xelatex_ext.builders.imageconv`)
+      (``xelatex_image_dpi``).
+
+    * native_index: If true, the general index is generated by the writer
+      (sorted by the collation rules of the language, if PyICU is installed),
+      else the index entries are written for ``makeindex`` (default)
+      (``xelatex_native_index``).
+
+    * stream_assembly: If true, the documents of the target are not inlined
+      into one doctree before the translation, each top-level document is
+      pulled in when the writer reaches it and released when it has been
+      translated, the peak memory does not grow with the size of the target
+      (``xelatex_stream_assembly``).  Ignored with ``split_fragments`` or
+      ``include_only``.
+
+    Optional config-names:
+
+    * tags: List of tags (``sphinx-build -t``), if not empty, the target is
+      only built if one of its tags is set.
+
+    The targets to build can be selected by a list of targetname patterns
+    (``fnmatch``) in ``xelatex_targets`` (e.g. ``sphinx-build -D
+    xelatex_targets=my_book-*``), the selected targets are listed in
+    :py:attr:`selected`.
+
     The following example shows, that the traditional *global* ``latex_*``
     settings are used as defaults on the *per-document* basis.
 
@@ -315,24 +369,42 @@ class XeLaTeXDocSet(DocSet):
         super(XeLaTeXDocSet, self).__init__(*args, **kwargs)
         self.additional_files = self.app.config.latex_additional_files
         self.logo             = self.app.config.latex_logo
+        self.selected         = []
 
         self.loadDocData()
+        self.selectDocs()
+
+    def selectDocs(self):
+        u"""Select the targets to build (see ``xelatex_targets`` and the
+        ``tags`` of the targets)."""
+        patterns = self.app.config.xelatex_targets
+        self.selected = [
+            docCfg for docCfg in self.docs
+            if (not patterns
+                or [p for p in patterns if fnmatch(docCfg.targetname, p)])
+            and (not docCfg.tags
+                 or [t for t in docCfg.tags if self.app.tags.has(t)])]
+        if self.docs and not self.selected:
+            self.app.warn("no target of '%s' is selected (xelatex_targets: %r)"
+                          % (self.cfg_name, patterns))
 
     def replacePendingRefsInTree(self, tree):
 
         # resolve :ref:s to distant tex files -- we can't add a cross-reference,
-        # but append the document name
+        # but append the document name (the target of a document is looked up
+        # in the label index of the builder)
 
+        label_index = self.app.builder.label_index
+        titles = dict([(cfg.targetname, cfg.title) for cfg in self.docs])
         for pendingnode in tree.traverse(addnodes.pending_xref):
             docname  = pendingnode['refdocname']
             sectname = pendingnode['refsectname']
             newnodes = [nodes.emphasis(sectname, sectname)]
-            for subdir, title in self.titles:
-                if docname.startswith(subdir):
-                    newnodes.append(nodes.Text(_(' (in '), _(' (in ')))
-                    newnodes.append(nodes.emphasis(title, title))
-                    newnodes.append(nodes.Text(')', ')'))
-                    break
+            title    = titles.get(label_index.target(docname))
+            if title:
+                newnodes.append(nodes.Text(_(' (in '), _(' (in ')))
+                newnodes.append(nodes.emphasis(title, title))
+                newnodes.append(nodes.Text(')', ')'))
             pendingnode.replace_self(newnodes)
 
     def loadDocData(self):
@@ -346,6 +418,13 @@ class XeLaTeXDocSet(DocSet):
             , domain_indices      = self.app.config.latex_domain_indices
             , toplevel_sectioning = self.app.config.latex_toplevel_sectioning
             , toctree_only        = False
+            , split_fragments     = self.app.config.xelatex_split_fragments
+            , include_only        = self.app.config.xelatex_include_only
+            , draft               = self.app.config.xelatex_draft
+            , image_dpi           = self.app.config.xelatex_image_dpi
+            , native_index        = self.app.config.xelatex_native_index
+            , stream_assembly     = self.app.config.xelatex_stream_assembly
+            , tags                = []
 
             # TODO: in which use-cases is a title required and not taken
             # from the startdoc?
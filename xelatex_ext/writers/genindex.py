@@ -0,0 +1,74 @@
+# -*- coding: utf-8; mode: python -*-
+# pylint: disable=C0330
+
+u"""
+    xelatex_ext.writers.genindex
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Locale-aware sorting of the general index.
+
+    :copyright:  Copyright (C) 2016 Markus Heiser
+    :license:    GPL V3.0, see LICENSE for details.
+
+    The general index of a target is generated by the XeLaTeX writer (no
+    ``makeindex`` / ``xindy`` run is needed, see ``xelatex_native_index``).
+    The entries are sorted by the collation rules of the document's language,
+    if `PyICU <https://pypi.python.org/pypi/PyICU>`_ is installed.  Without
+    PyICU, the entries are sorted case-insensitive by their decomposed (NFD)
+    text, so accented letters are sorted next to their base letters.
+"""
+
+# ==============================================================================
+#  imports
+# ==============================================================================
+
+import unicodedata
+
+from six import text_type
+
+from sphinx.locale import _
+
+try:
+    import icu
+except ImportError:
+    icu = None
+
+# ==============================================================================
+class Collator(object):
+# ==============================================================================
+
+    u"""Sort keys of index entries.
+
+    :param str lang_code: Language code of the document (e.g. ``de``).
+    """
+
+    def __init__(self, lang_code):
+        self.collator = None
+        if icu is not None:
+            locale = icu.Locale(lang_code.replace('-', '_'))
+            self.collator = icu.Collator.createInstance(locale)
+
+    def __call__(self, text):
+        text = text_type(text)
+        if self.collator is not None:
+            return (self.collator.getSortKey(text), text)
+        return (unicodedata.normalize('NFD', text.lower()), text)
+
+# ==============================================================================
+def sort_index(content, collator):
+# ==============================================================================
+
+    u"""Sort the *content* of the index (see
+    ``sphinx.environment.BuildEnvironment.create_index``) by *collator*.
+
+    The letters (groups) are kept, the ``Symbols`` group comes first."""
+
+    symbols = _('Symbols')
+    retVal  = []
+    for letter, entries in sorted(
+            content, key=lambda item: (item[0] != symbols, collator(item[0]))):
+        entries = sorted(entries, key=lambda entry: collator(entry[0]))
+        for _name, (_links, subitems, _key) in entries:
+            subitems.sort(key=lambda item: collator(item[0]))
+        retVal.append((letter, entries))
+    return retVal
@@ -16,9 +16,12 @@ u"""
 #  imports ...
 # ==============================================================================
 
+import copy
 import re
 import sys
+import tempfile
 from contextlib import contextmanager
+from os import path
 
 from six import text_type, itervalues
 
@@ -29,7 +32,13 @@ from docutils.writers.latex2e import CharMaps, PreambleCmds
 from sphinx import highlighting
 from sphinx import addnodes
 from sphinx.locale import admonitionlabels, _
+from sphinx.util import split_into
 
+from xelatex_ext import __version__
+from xelatex_ext.builders.fingerprint import data_digest
+from xelatex_ext.builders.outfile import write_chunks_if_changed
+from xelatex_ext.builders.texlog import marker
+from xelatex_ext.writers.genindex import Collator, sort_index
 from xelatex_ext.writers.polyglossia import Polyglossia
 
 # ==============================================================================
@@ -61,6 +70,21 @@ class cmap(CharMaps):
     def maskID(cls, ID):
         return text_type(ID).translate(cls.IDs)
 
+# ==============================================================================
+def tex_length(length):
+# ==============================================================================
+
+    u"""Return the TeX length of the reST *length* (e.g. ``50%``, ``300px``)."""
+
+    match = re.match(r'^([0-9.]+)\s*(%|px|)$', length.strip())
+    if match is None:
+        return length
+    value, unit = match.groups()
+    if unit == '%':
+        return '%s\\linewidth' % (float(value) / 100.0)
+    # pixels (reST default unit) with 96 dpi
+    return '%sbp' % (float(value) * 0.75)
+
 # ==============================================================================
 class collected_footnote(nodes.footnote):
 # ==============================================================================
@@ -69,6 +93,52 @@ class collected_footnote(nodes.footnote):
 
     pass
 
+# ==============================================================================
+class fragment_include(nodes.Element):
+# ==============================================================================
+
+    """Placeholder of a ``start_of_file`` subtree, which is written into a
+    fragment file (attribute ``filename``) and included by ``\\include``."""
+
+    pass
+
+# ==============================================================================
+def fragment_boundaries(document):
+# ==============================================================================
+
+    u"""Return the top-level ``start_of_file`` subtrees of *document*.
+
+    Returns a list of ``(node, state)`` tuples.  The *state* is the state of
+    the translator at the boundary of the subtree (see
+    :py:meth:`XeLaTeXTranslator.set_fragment_state`).  This is a cheap pre-pass,
+    it only counts sections, so the counters at each boundary are fixed before
+    the fragments are translated independently of each other.
+    """
+
+    boundaries  = []
+    sectCounter = [1, ]
+
+    def walk(node, curfile, toplevel):
+        for child in node.children:
+            if not isinstance(child, nodes.Element):
+                continue
+            if isinstance(child, addnodes.start_of_file):
+                if toplevel:
+                    boundaries.append((child, dict(
+                        sectCounter    = list(sectCounter)
+                        , curfilestack = [curfile])))
+                walk(child, child['docname'], False)
+            elif isinstance(child, nodes.section):
+                sectCounter[-1] += 1
+                sectCounter.append(1)
+                walk(child, curfile, toplevel)
+                sectCounter.pop()
+            else:
+                walk(child, curfile, toplevel)
+
+    walk(document, document.get('docname', ''), True)
+    return boundaries
+
 # ==============================================================================
 class tex(object):
 # ==============================================================================
@@ -90,10 +160,11 @@ class tex(object):
     @staticmethod
     @contextmanager
     def begin(environment, outList=None):
-        outList = outList or []
+        if outList is None:
+            outList = []
         outList.append("\\begin{%s}\n" % environment)
         yield outList
-        outList.append("\\begin{%s}\n" % environment)
+        outList.append("\\end{%s}\n" % environment)
 
     @staticmethod
     def renewcommand(cmd, defn, nargs=0, optarg=None):
@@ -173,6 +244,35 @@ class XeLaTeXWriter(writers.Writer):
         self.document.walkabout(visitor)
         self.output = visitor.astext()
 
+    def write_stream(self, document, fname):
+        u"""Translate *document* into file *fname* (see ``stream_assembly``).
+
+        The output of each released subtree is spooled to a temporary file,
+        the complete output is never held in memory.  The file *fname* is only
+        replaced if its content has been changed, returns ``True`` if the file
+        has been written."""
+        self.document = document
+        visitor = self.translator_class(document, self.builder)
+        with tempfile.TemporaryFile() as spool:
+            visitor.spool = spool
+            document.walkabout(visitor)
+            head, tail = visitor.astext_parts()
+            spool.write(u''.join(visitor.out).encode('utf-8'))
+            spool.seek(0)
+            return write_chunks_if_changed(
+                fname, [head.encode('utf-8'), spool, tail.encode('utf-8')])
+
+    def translate_fragment(self, document, node, state):
+        u"""Translate the ``start_of_file`` subtree *node* of *document*.
+
+        The *state* is the state of the translator at the boundary of the
+        subtree (see :py:func:`fragment_boundaries`).  Returns the result of
+        :py:meth:`XeLaTeXTranslator.fragment_result`."""
+        visitor = self.translator_class(document, self.builder)
+        visitor.set_fragment_state(state)
+        node.walkabout(visitor)
+        return visitor.fragment_result()
+
 
 # ==============================================================================
 class Translator(object):
@@ -283,15 +383,38 @@ class Translator(object):
 class XeLaTeX_TEMPLATES(object):
     """Building blocks for XeLaTeX templates
 
+    * PREAMBLE
+    * SHARED_PREAMBLE
     * HEADER
     * BEGIN_DOC
     * FOOTER
+
+    The static part of the preamble (``PREAMBLE``) is the same for all targets,
+    it is either inlined in the ``HEADER`` or (``xelatex_shared_preamble``)
+    read from the shared preamble file ``SHARED_PREAMBLE``.  This file can
+    also be dumped into a format (``xelatex_preamble_format``), in this case
+    the ``\input`` is skipped.
     """
 
+    PREAMBLE = r"""\usepackage{fixltx2e}
+\usepackage{fontspec}"""
+
+    SHARED_PREAMBLE = r"""%% Shared preamble generated by xelatex sphinx-extension.
+\RequirePackage{fixltx2e}
+\RequirePackage{fontspec}
+\RequirePackage{polyglossia}
+%(styles)s
+%% Fallback definitions for Docutils-specific commands
+%(requirements)s
+\def\sphinxxelatexpreamble{}
+"""
+
+    INPUT_SHARED_PREAMBLE = (
+        r"\ifdefined\sphinxxelatexpreamble\else\input{%(preamble_file)s}\fi")
+
     HEADER = r"""%% Generated by xelatex sphinx-extension.
 %% set program xelatex
-\usepackage{fixltx2e}
-\usepackage{fontspec}
+%(xrpackage)s%(shared_preamble)s
 
 %(requirements)s
 
@@ -304,11 +427,13 @@ class XeLaTeX_TEMPLATES(object):
 %% Fallback definitions for Docutils-specific commands
 %(fallbacks)s
 %(pdfsetup)s
+%(includeonly)s
+%(externaldocs)s
 
 
 
 $titledata
-%%% Body
+%%%% Body
 \begin{document}
 $body_pre_docinfo$docinfo$dedication$abstract$body
 \end{document}
@@ -403,15 +528,29 @@ class DocumentClass(object):
 class Requirements(object):
 # ==============================================================================
 
-    def __init__(self):
+    u"""Fallback definitions required by the document.
+
+    The definitions of the ``shareable`` requirements do not depend on the
+    document, they are put in the shared preamble (see
+    :py:meth:`XeLaTeXTranslator.shared_preamble`).  If *shared* is True, they
+    are omitted in the output of :py:meth:`__call__`.
+    """
+
+    shareable = ('admonition', 'align_center', 'error', 'inline', 'title'
+                 , 'titlereference', '__static')
+
+    def __init__(self, shared=False):
+        self.shared    = shared
         self.active    = set()
         self.available = dict(
             admonition         = PreambleCmds.admonition
             , align_center     = PreambleCmds.align_center
             , color            = PreambleCmds.color
             , error            = PreambleCmds.error
+            , fancyvrb         = r'\usepackage{fancyvrb}'
+            , graphicx         = r'\usepackage{graphicx}'
             , inline           = PreambleCmds.inline
-            , secnumdepth      = PreambleCmds.secnumdepth
+            , secnumdepth      = getattr(PreambleCmds, 'secnumdepth', '')
             , title            = PreambleCmds.title
             , titlereference   = PreambleCmds.titlereference
             , __static         = r'\usepackage{ifthen}'
@@ -423,7 +562,13 @@ class Requirements(object):
         self.active.add(reqname)
 
     def __call__(self):
-        return "\n".join([self.available[name] for name in self.active])
+        # sorted: the preamble must not depend on the order of the set
+        return "\n".join([
+            self.available[name] for name in sorted(self.active)
+            if not (self.shared and name in self.shareable)])
+
+    def shared_preamble(self):
+        return "\n".join([self.available[name] for name in self.shareable])
 
 # ==============================================================================
 class XeLaTeXTranslator(Translator):
@@ -466,6 +611,13 @@ class XeLaTeXTranslator(Translator):
         , 'tableofcontents': '\\tableofcontents'
         , 'footer':          ''
         , 'printindex':      '\\printindex'
+        , 'fallbacks':       ''
+        , 'pdfsetup':        ''
+        , 'tocdepth':        ''
+        , 'preamble_file':   'xelatex-preamble'
+        , 'includeonly':     ''
+        , 'xrpackage':       ''
+        , 'externaldocs':    ''
         }
 
     def __init__(self, document, builder):
@@ -476,26 +628,46 @@ class XeLaTeXTranslator(Translator):
         self.settings     = document.settings
         self.d_class      = DocumentClass(docCfg)
         self.polyglossia  = Polyglossia(self.settings.language_code)
-        self.requirements = Requirements()
+        self.requirements = Requirements(
+            shared = self.builder.config.xelatex_shared_preamble)
 
         # elements
         # --------
 
-        self.elements = self.default_ctx.copy()
+        self.elements = Container(self.default_ctx)
         self.elements.update(docCfg)
+        if self.requirements.shared:
+            self.elements.shared_preamble = (
+                self.TEMPLATES.INPUT_SHARED_PREAMBLE % self.elements)
+        else:
+            self.elements.shared_preamble = self.TEMPLATES.PREAMBLE
         self.elements.documentoptions = self.d_class.documentoptions
         self.elements.documentclass   = self.d_class.documentclass
         self.elements.language        = self.polyglossia.language
+        self.elements.indexname       = _('Index')
+        if docCfg.native_index:
+            # the general index is generated by generate_general_index
+            self.elements.makeindex   = ''
+
+        # requirements of the fragments (see XeLaTeXWriter.translate_fragment)
+        for fragment in getattr(document, 'fragments', ()):
+            self.requirements.active.update(fragment['requirements'])
+            self.polyglossia.other_langs.update(fragment['other_langs'])
+        if getattr(document, 'includeonly', None) is not None:
+            self.elements.includeonly = (
+                '\\includeonly{%s}' % ','.join(document.includeonly))
 
         # common flags & stacks
         # ---------------------
 
         self.out                = []
+        self.spool              = None   # see XeLaTeXWriter.write_stream
+        self.fragment_cache     = getattr(builder, 'fragment_cache', None)
+        self.fragments_open     = 0
         self.bibitems           = []
         self.in_title           = False
         self.in_minipage        = False
 
-        self.body               = []
         self.table              = None
         self.next_table_colspec = None
 
@@ -541,11 +713,14 @@ class XeLaTeXTranslator(Translator):
         from sphinx.util import texescape
         texescape.init()
 
-        self.highlighter = highlighting.PygmentsBridge(
-            'latex'
-            , self.builder.config.pygments_style or 'tango'  # prefer tango as default
-            , self.builder.config.trim_doctest_flags
-        )
+        # draft mode: no highlighting, literal blocks are plain verbatim
+        self.highlighter = None
+        if not docCfg.draft:
+            self.highlighter = highlighting.PygmentsBridge(
+                'latex'
+                , self.builder.config.pygments_style or 'tango'  # prefer tango as default
+                , self.builder.config.trim_doctest_flags
+            )
         # stack of [language, linenothreshold] settings per file the first item
         # here is the default and must not be changed the second item is the
         # default for the master file and can be changed by .. highlight::
@@ -575,17 +750,101 @@ class XeLaTeXTranslator(Translator):
                 footnode.walkabout(self)
             self.pending_footnotes = []
 
+    def set_fragment_state(self, state):
+        u"""Set the state at the boundary of a fragment (see
+        :py:func:`fragment_boundaries`)."""
+        self.d_class.sectCounter = list(state['sectCounter'])
+        self.curfilestack        = list(state['curfilestack'])
+        self.this_is_the_title   = 0
+
+    fragment_settings = ('documentclass', 'toplevel_sectioning', 'use_parts'
+                         , 'show_urls', 'show_pagerefs', 'draft', 'native_index')
+    u"""Names of the *per-document* settings which have an effect on the
+    translation of a fragment (see :py:meth:`fragment_key`)."""
+
+    def fragment_key(self, node):
+        u"""Return the key of the ``start_of_file`` subtree *node* in the
+        fragment cache (see ``xelatex_fragment_cache``).
+
+        The key is a digest of the resolved subtree, the images of the subtree
+        (content, bounding box and file name, see
+        :py:meth:`XeLaTeXBuilder.image_fingerprint`), the section level, the
+        :py:attr:`fragment_settings` of the target, the related global settings
+        and the version of this extension."""
+        docCfg = self.document.docCfg
+        config = self.builder.config
+        images = [self.builder.image_fingerprint(
+                      image['uri'], image.get('xelatex_file'))
+                  for image in node.traverse(nodes.image)]
+        return data_digest(dict(
+            version    = __version__
+            , tree     = node.pformat()
+            , images   = images
+            , level    = self.d_class.sectionlevel
+            , settings = [docCfg.get(name) for name in self.fragment_settings]
+            , config   = [config.highlight_language, config.pygments_style
+                          , config.trim_doctest_flags, config.language
+                          , config.xelatex_shared_preamble]))
+
+    def use_fragment(self, entry):
+        u"""Add the cached fragment *entry* to the output (see
+        :py:meth:`fragment_key`)."""
+        self.out.append(entry['output'])
+        self.requirements.active.update(entry['requirements'])
+        self.polyglossia.other_langs.update(entry['other_langs'])
+        self.d_class.sectCounter[-1] += entry['sections']
+
+    def fragment_result(self):
+        u"""Return the output of a translated fragment and the requirements
+        it adds to the preamble of the master document."""
+        return dict(
+            output         = u''.join(self.out)
+            , requirements = sorted(self.requirements.active)
+            , other_langs  = sorted(self.polyglossia.other_langs))
+
+    @classmethod
+    def shared_preamble(cls, styles=()):
+        u"""Return the content of the shared preamble file.
+
+        :param list styles: names of the (``xetex_inputs``) packages required
+            by the shared preamble."""
+        return cls.TEMPLATES.SHARED_PREAMBLE % dict(
+            styles = '\n'.join([r'\RequirePackage{%s}' % s for s in styles])
+            , requirements = Requirements().shared_preamble())
+
     def astext(self):
-        from linuxdoc.kernel_doc import CONSOLE
-        CONSOLE()
-        return (
-            self.TEMPLATES.HEADER % self.elements
-            + self.highlighter.get_stylesheet()
-            + u''.join(self.body)
-            + '\n' + self.elements['footer'] + '\n'
+        head, tail = self.astext_parts()
+        return head + u''.join(self.out) + tail
+
+    def astext_parts(self):
+        u"""Return the TeX code before and after the body (:py:attr:`out`) of
+        the document."""
+        self.elements.requirements = self.requirements()
+        if self.document.docCfg.native_index:
+            self.elements.printindex = self.generate_general_index()
+        external_docs = getattr(self.document, 'external_docs', None)
+        if external_docs:
+            # references into other targets (xr-hyper), the labels of the
+            # target are prefixed by its jobname and linked to its PDF;
+            # xr-hyper has to be loaded before hyperref
+            self.elements.xrpackage = '\\usepackage{xr-hyper}\n'
+            self.elements.externaldocs = '\n'.join([
+                r'\externaldocument[%s-][%s.pdf]{%s}' % (jobname, jobname, jobname)
+                for jobname in sorted(external_docs)])
+        fmtline = ''
+        if self.requirements.shared and self.builder.config.xelatex_preamble_format:
+            # load the format dumped from the shared preamble (XeTeX parses
+            # the first line)
+            fmtline = '%%&%s\n' % self.elements.preamble_file
+        head = (
+            fmtline
+            + self.TEMPLATES.HEADER % self.elements
+            + (self.highlighter and self.highlighter.get_stylesheet() or ''))
+        tail = (
+            '\n' + self.elements['footer'] + '\n'
             + self.generate_indices()
-            + self.TEMPLATES.FOOTER % self.elements
-            )
+            + self.TEMPLATES.FOOTER % self.elements)
+        return head, tail
 
     def attval(self, text, whitespace=re.compile('[\n\r\t\v\f]')):
         """Cleanse, encode, and return attribute value text."""
@@ -641,8 +900,9 @@ class XeLaTeXTranslator(Translator):
         ret = []
         # latex_domain_indices can be False/True or a list of index names
         indices_config = self.document.docCfg.domain_indices
-        if indices_config:
-            for domain in itervalues(self.builder.env.domains):
+        if indices_config and not self.document.docCfg.draft:
+            for domain in sorted(itervalues(self.builder.env.domains)
+                                 , key=lambda domain: domain.name):
                 for indexcls in domain.indices:
                     indexname = '%s-%s' % (domain.name, indexcls.name)
                     if (isinstance(indices_config, list)
@@ -657,6 +917,42 @@ class XeLaTeXTranslator(Translator):
 
         return ''.join(ret)
 
+    def generate_general_index(self):
+        u"""Return the general index of the target (``theindex``), the entries
+        are sorted by the collation of the document's language (see
+        :py:mod:`xelatex_ext.writers.genindex`)."""
+        def pagerefs(links):
+            return ''.join([
+                (main and ', \\textbf{\\pageref{%s}}' or ', \\pageref{%s}')
+                % cmap.maskID(uri[1:].replace('#', ':'))
+                for main, uri in links])
+
+        # only the entries of the documents in the target, the index is created
+        # by a (shallow) copy of the environment, which is shared by the
+        # targets
+        env = copy.copy(self.builder.env)
+        env.indexentries = dict([
+            (docname, entries)
+            for docname, entries in self.builder.env.indexentries.items()
+            if docname in self.builder.docnames])
+        content = env.create_index(self.builder)
+        if not content:
+            return ''
+
+        ret = []
+        with tex.begin("theindex", ret):
+            for i, (letter, entries) in enumerate(
+                    sort_index(content, Collator(self.settings.language_code))):
+                if i > 0:
+                    ret.append('\\indexspace\n')
+                ret.append('%s\n' % cmap.mask(letter))
+                for name, (links, subitems, _key) in entries:
+                    ret.append('\\item %s%s\n' % (cmap.mask(name), pagerefs(links)))
+                    for subname, sublinks in subitems:
+                        ret.append('\\subitem %s%s\n'
+                                   % (cmap.mask(subname), pagerefs(sublinks)))
+        return ''.join(ret)
+
     # ------------------------------------------------------------
     # common visitors
     # ------------------------------------------------------------
@@ -665,6 +961,12 @@ class XeLaTeXTranslator(Translator):
         self.out.extend(ctx.body)
         self.out.extend(ctx.end_tags)
 
+    def skip_node(self, node, ctx):
+        u"""Output the *ctx* of *node* and skip its children and departure."""
+        self.pop_ctx(node.__class__.__name__)
+        self.default_depart(node, ctx)
+        raise nodes.SkipNode
+
     depart_inline = default_depart
     def visit_inline(self, node, ctx): # <span>, i.e. custom roles
         for cls in node['classes']:
@@ -702,22 +1004,77 @@ class XeLaTeXTranslator(Translator):
     # ------------------------------------------------------------
 
     def visit_start_of_file(self, node, ctx):
+        # a lazy subtree is pulled in now and released when it has been
+        # translated (see depart_start_of_file)
+        ctx.release = node.get('xelatex_lazy', False)
+        if ctx.release and not self.builder.load_subtree(self.document, node):
+            node.parent.remove(node)
+            self.pop_ctx(node.__class__.__name__)
+            raise nodes.SkipNode
+        ctx.fragment_key = None
+        if self.fragment_cache is not None and not self.this_is_the_title:
+            ctx.fragment_key = self.fragment_key(node)
+            entry = self.fragment_cache.get(ctx.fragment_key)
+            if entry is not None:
+                self.use_fragment(entry)
+                self.pop_ctx(node.__class__.__name__)
+                raise nodes.SkipNode
+            # collect the output and requirements of this fragment (see
+            # depart_start_of_file)
+            ctx.fragment_start = len(self.out)
+            self.fragments_open += 1
+            ctx.fragment_outer = (self.requirements.active
+                                  , self.polyglossia.other_langs
+                                  , self.d_class.sectCounter[-1])
+            self.requirements.active      = set()
+            self.polyglossia.other_langs  = set()
+
+        # mark the start of the file in the TeX log (see TeXLogParser)
+        self.out.append(marker('start-of-file', node['docname']))
         # collect new footnotes
         self.footnotestack.append(self.collect_footnotes(node))
-        # also add a document target
-        self.next_section_ids.add(':doc')
         self.curfilestack.append(node['docname'])
+        # also add a document target (the anchor of references to the
+        # document, see visit_reference)
+        self.out.append(self.hypertarget(':doc'))
         # use default highlight settings for new file
         self.hlsettingstack.append(self.hlsettingstack[0])
 
+    def visit_fragment_include(self, node, ctx):
+        self.out.append(u'\\include{%s}\n' % node['filename'])
+        raise nodes.SkipNode
+
     def depart_start_of_file(self, node, ctx):
+        self.out.append(marker('end-of-file', node['docname']))
         self.footnotestack.pop()
         self.curfilestack.pop()
         self.hlsettingstack.pop()
 
+        if ctx.fragment_key is not None:
+            self.fragments_open -= 1
+            requirements, other_langs, sections = ctx.fragment_outer
+            entry = dict(
+                output         = u''.join(self.out[ctx.fragment_start:])
+                , requirements = sorted(self.requirements.active)
+                , other_langs  = sorted(self.polyglossia.other_langs)
+                , sections     = self.d_class.sectCounter[-1] - sections)
+            self.fragment_cache.set(ctx.fragment_key, entry)
+            requirements.update(self.requirements.active)
+            other_langs.update(self.polyglossia.other_langs)
+            self.requirements.active     = requirements
+            self.polyglossia.other_langs = other_langs
+        if ctx.release:
+            node.children = []
+            if self.spool is not None and not self.fragments_open:
+                # stream the output of the released subtree (the output of
+                # a fragment is collected until the fragment is complete)
+                self.spool.write(u''.join(self.out).encode('utf-8'))
+                del self.out[:]
+
     def visit_document(self, node, ctx):
         self.footnotestack.append(self.collect_footnotes(node))
         self.curfilestack.append(node.get('docname', ''))
+        self.out.append(marker('start-of-file', node.get('docname', '')))
 
         if self.first_document == 1:
             # the first document is all the regular content ...
@@ -744,9 +1101,13 @@ class XeLaTeXTranslator(Translator):
             ctx.body.push(u'\\end{thebibliography}\n')
             self.bibitems = []
         self.default_depart(node, ctx)
+        self.out.append(marker('end-of-file', node.get('docname', '')))
 
     def visit_section(self, node, ctx):
         self.d_class.enter_section()
+        # anchors of the references (and of references from other targets,
+        # see xelatex_ext.builders.labels)
+        self.out.extend([self.hypertarget(ID) for ID in node['ids']])
 
     def depart_section(self, node, ctx):
         self.d_class.leave_section()
@@ -774,6 +1135,8 @@ class XeLaTeXTranslator(Translator):
 
             self.pdfinfo.append('  pdftitle={%s},' % self.elements['title'] )
             self.this_is_the_title = 0
+            # depart_title is skipped
+            self.in_title = False
             raise nodes.SkipNode
 
         # Topic titles (topic, admonition, sidebar)
@@ -833,7 +1196,7 @@ class XeLaTeXTranslator(Translator):
             ctx.body.push(u'\n')
         if node.get('ids'):
             ctx.body.extend(tex.ids_to_labels(node))
-            ctx.push('\n')
+            ctx.body.push('\n')
         if node['classes']:
             self.visit_inline(node, ctx)
         ctx.end_tags.push('\n')
@@ -949,6 +1312,120 @@ class XeLaTeXTranslator(Translator):
         self.hlsettingstack[-1] = [node['lang'], node['linenothreshold']]
         raise nodes.SkipNode
 
+    depart_reference = default_depart
+    def visit_reference(self, node, ctx):
+        uri = node.get('refuri', '')
+        if not uri and node.get('refid'):
+            uri = '%' + self.curfilestack[-1] + '#' + node['refid']
+        if self.in_title or not uri:
+            return
+        if uri.startswith('%') or uri.startswith('xr:'):
+            # internal or into another target: xr:<jobname>%<docname>#<id>
+            prefix = ''
+            if uri.startswith('xr:'):
+                prefix, uri = uri[3:].split('%', 1)
+                prefix += '-'
+            else:
+                uri = uri[1:]
+            docname, _, refid = uri.partition('#')
+            ctx.body.push(self.hyperlink(
+                '%s%s:%s' % (prefix, docname, refid or ':doc')))
+            ctx.end_tags.push('}}')
+        else:
+            ctx.body.push(r'\href{%s}{' % cmap.mask(uri))
+            ctx.end_tags.push('}')
+
+    def visit_index(self, node, ctx, scre=re.compile(r';\s*')):
+        if self.document.docCfg.native_index:
+            # anchors of the page references in the general index
+            for tid in sorted(set([entry[2] for entry in node['entries']])):
+                ctx.body.push(self.hypertarget(tid))
+            self.skip_node(node, ctx)
+        for etype, string, _tid, ismain, _key in node['entries']:
+            m = ismain and '|textbf' or ''
+            try:
+                if etype == 'single':
+                    p = scre.sub('!', cmap.mask(string))
+                    ctx.body.push(r'\index{%s%s}' % (p, m))
+                elif etype == 'pair':
+                    p1, p2 = [cmap.mask(x) for x in split_into(2, 'pair', string)]
+                    ctx.body.push(r'\index{%s!%s%s}\index{%s!%s%s}'
+                                  % (p1, p2, m, p2, p1, m))
+                elif etype == 'triple':
+                    p1, p2, p3 = [cmap.mask(x)
+                                  for x in split_into(3, 'triple', string)]
+                    ctx.body.push(
+                        r'\index{%s!%s %s%s}\index{%s!%s, %s%s}\index{%s!%s %s%s}'
+                        % (p1, p2, p3, m, p2, p3, p1, m, p3, p1, p2, m))
+                elif etype in ('see', 'seealso'):
+                    p1, p2 = [cmap.mask(x) for x in split_into(2, etype, string)]
+                    ctx.body.push(r'\index{%s|see{%s}}' % (p1, p2))
+                else:
+                    self.builder.warn('unknown index entry type %s found' % etype)
+            except ValueError as err:
+                self.builder.warn(str(err))
+        self.skip_node(node, ctx)
+
+    def visit_literal_block(self, node, ctx):
+        code = node.astext()
+        if self.highlighter is None:
+            # draft mode
+            ctx.body.push('\n\\begin{verbatim}\n%s\n\\end{verbatim}\n' % code)
+            self.skip_node(node, ctx)
+        lang    = self.hlsettingstack[-1][0]
+        linenos = code.count('\n') >= self.hlsettingstack[-1][1] - 1
+        highlight_args = node.get('highlight_args', {})
+        if node.rawsource != code:
+            # most probably a parsed-literal block -- don't highlight
+            lang = 'none'
+        elif 'language' in node:
+            # code-block directives
+            lang = node['language']
+            highlight_args['force'] = True
+        if 'linenos' in node:
+            linenos = node['linenos']
+        if lang is self.hlsettingstack[0][0]:
+            # only pass highlighter options for original language
+            opts = self.builder.config.highlight_options
+        else:
+            opts = {}
+        def warner(msg):
+            self.builder.warn(msg, (self.curfilestack[-1], node.line))
+        self.requirements.add('color')
+        self.requirements.add('fancyvrb')
+        ctx.body.push('\n' + self.highlighter.highlight_block(
+            code, lang, opts=opts, warn=warner, linenos=linenos
+            , **highlight_args).rstrip() + '\n')
+        self.skip_node(node, ctx)
+
+    visit_doctest_block = visit_literal_block
+
+    def visit_image(self, node, ctx):
+        self.requirements.add('graphicx')
+        uri     = node['uri']
+        options = ['%s=%s' % (name, tex_length(node[name]))
+                   for name in ('width', 'height') if name in node]
+        if 'scale' in node:
+            options.append('scale=%s' % (float(node['scale']) / 100.0))
+        # the natural size of the image, XeTeX has not to read the image file
+        # for it
+        bbox = self.builder.image_bbox(uri)
+        if self.document.docCfg.draft:
+            # draft mode: a placeholder in the size of the image, the image
+            # file is not required (not copied by the builder)
+            if bbox is None:
+                ctx.body.push('\\fbox{\\texttt{%s}}' % cmap.mask(uri))
+                self.skip_node(node, ctx)
+            options.insert(0, 'draft')
+            fname = path.normpath(uri)
+        else:
+            fname = node.get('xelatex_file') or self.builder.images.get(uri, uri)
+        if bbox is not None:
+            options.insert(0, 'bb=%s %s %s %s' % tuple(bbox))
+        ctx.body.push('\\includegraphics[%s]{%s}'
+                      % (','.join(options), fname))
+        self.skip_node(node, ctx)
+
     def visit_topic(self, node, ctx):
         self.in_minipage = True
         ctx.body.push('\n\\begin{SphinxShadowBox}\n')